@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite
+
+Times the building blocks of the challenges at several input sizes, plus the
+full chal12 and chal14 attacks, which are also measured in oracle queries.
+Results are keyed by "name/size" and stored as JSON, so a run can be compared
+against the baseline checked in at benchmarks/baseline.json.
+
+Clock speed can drift from one run to the next, so a short fixed calibration
+loop is timed right before each benchmark. compare() scales the baseline by the
+ratio of the median calibration times of the two runs, which cancels out most
+of the drift. Baselines are still only meaningful for the machine they were saved on.
+Re-save the baseline after an intended performance change or when moving to a
+different machine.
+
+Usage:
+    bench.py run [-k FILTER] [-o OUTPUT]
+    bench.py save [-k FILTER] [--baseline PATH]
+    bench.py compare [-k FILTER] [--baseline PATH] [--threshold FRACTION] [RESULTS]
+
+compare exits with status 1 if any benchmark is slower than the baseline by
+more than the threshold (default 50%), or needs more oracle queries. Flagged
+benchmarks are run again up to twice, and their fastest run is kept, before
+they count as regressions.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import timeit
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+DEFAULT_THRESHOLD = 0.5
+
+
+@dataclass
+class Benchmark:
+    name: str
+    sizes: Sequence[int]
+    # Returns the function to time for an input size
+    setup: Callable[[int], Callable[[], Optional[dict]]]
+    # Slow benchmarks are run three times rather than in a timing loop. Their
+    # function may return a dict of extra metrics, e.g. oracle queries.
+    repeat: bool = True
+
+
+BENCHMARKS: List[Benchmark] = []
+
+
+def benchmark(name: str, sizes: Sequence[int], repeat: bool = True):
+    def decorator(setup):
+        BENCHMARKS.append(Benchmark(name, sizes, setup, repeat))
+        return setup
+    return decorator
+
+
+def random_bytes(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def challenge_6_data(size: int) -> bytes:
+    import datasets
+    return bytes(datasets.blob('6.txt')[:size])
+
+
+@benchmark('b64encode', (1024, 16384))
+def bench_b64encode(size):
+    from chal1 import b64encode
+    data = random_bytes(size)
+    return lambda: b64encode(data)
+
+
+@benchmark('xor_by', (1024, 65536))
+def bench_xor_by(size):
+    from chal2 import xor_by
+    data, key = random_bytes(size, 1), random_bytes(size, 2)
+    return lambda: xor_by(data, key)
+
+
+@benchmark('ice_encode', (1024, 65536))
+def bench_ice_encode(size):
+    from chal5 import ice_encode
+    data = random_bytes(size)
+    return lambda: ice_encode(data)
+
+
+@benchmark('find_xor_key', (64, 1024))
+def bench_find_xor_key(size):
+    from chal4 import find_xor_key
+    data = random_bytes(size)
+    return lambda: find_xor_key(data)
+
+
+@benchmark('hamming_distance', (1024, 65536))
+def bench_hamming_distance(size):
+    from chal6 import hamming_distance
+    a, b = random_bytes(size, 1), random_bytes(size, 2)
+    return lambda: hamming_distance(a, b)
+
+
+@benchmark('get_keysizes', (1024, 2876))
+def bench_get_keysizes(size):
+    from chal6 import get_keysizes
+    data = challenge_6_data(size)
+    return lambda: get_keysizes(data)
+
+
+@benchmark('break_repeating_xor_key', (1024, 2876))
+def bench_break_repeating_xor_key(size):
+    from chal6 import break_repeating_xor_key
+    data = challenge_6_data(size)
+    return lambda: break_repeating_xor_key(data)
+
+
+@benchmark('AES_CBC.encrypt', (1024, 65536))
+def bench_cbc_encrypt(size):
+    from chal10 import AES_CBC
+    cipher = AES_CBC(b'YELLOW SUBMARINE', bytes(16))
+    data = random_bytes(size)
+    return lambda: cipher.encrypt(data)
+
+
+@benchmark('AES_CBC.decrypt', (1024, 65536))
+def bench_cbc_decrypt(size):
+    from chal10 import AES_CBC
+    cipher = AES_CBC(b'YELLOW SUBMARINE', bytes(16))
+    data = random_bytes(size)
+    return lambda: cipher.decrypt(data)
+
+
+@benchmark('detect_aes_ecb', (1024, 65536))
+def bench_detect_aes_ecb(size):
+    from chal8 import detect_aes_ecb
+    data = random_bytes(size)
+    return lambda: detect_aes_ecb(data)
+
+
+@benchmark('chal12 attack', (32, 138), repeat=False)
+def bench_chal12_attack(size):
+    from chal12 import Oracle, decrypt_secret
+    from oracle_core import SECRET_SUFFIX
+
+    def attack():
+        oracle = Oracle(key=b'YELLOW SUBMARINE')
+        oracle.core.suffix = SECRET_SUFFIX[:size]
+        block_size = oracle.detect_block_size()
+        assert decrypt_secret(oracle, block_size) == SECRET_SUFFIX[:size]
+        return {'queries': oracle.metrics.calls}
+    return attack
+
+
+@benchmark('chal14 attack', (32, 138), repeat=False)
+def bench_chal14_attack(size):
+    from chal14 import Oracle, decrypt_secret
+    from oracle_core import SECRET_SUFFIX
+
+    def attack():
+        oracle = Oracle(key=b'YELLOW SUBMARINE', random_prefix=b'\x8a\x13\x07')
+        oracle.core.suffix = SECRET_SUFFIX[:size]
+        prefix_length, block_size = oracle.detect_block_size()
+        assert decrypt_secret(oracle, block_size, prefix_length) == SECRET_SUFFIX[:size]
+        return {'queries': oracle.metrics.calls}
+    return attack
+
+
+def calibrate() -> float:
+    """
+    Times a fixed pure Python workload, as a measure of the current speed of
+    the machine
+    """
+    return min(timeit.repeat(lambda: sum(i * i for i in range(20000)), repeat=10, number=3)) / 3
+
+
+def run_benchmark(bench: Benchmark, size: int) -> dict:
+    func = bench.setup(size)
+    calibration = calibrate()
+    # The fastest of a few repeats is the least disturbed by other processes
+    if not bench.repeat:
+        times = []
+        for _ in range(3):
+            start = timeit.default_timer()
+            extra = func()
+            times.append(timeit.default_timer() - start)
+        return {'seconds': min(times), 'calibration': calibration, **(extra or {})}
+
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=5, number=number)) / number
+    return {'seconds': seconds, 'calibration': calibration}
+
+
+def run(pattern: str = '', output=sys.stdout, keys: Optional[Sequence[str]] = None) -> Dict[str, dict]:
+    results = {}
+    for bench in BENCHMARKS:
+        for size in bench.sizes:
+            key = f'{bench.name}/{size}'
+            if pattern not in key or (keys is not None and key not in keys):
+                continue
+            results[key] = result = run_benchmark(bench, size)
+            extra = ''.join(f', {name}={value}' for name, value in result.items()
+                            if name not in ('seconds', 'calibration'))
+            print(f'{key:<32} {result["seconds"] * 1e3:>12.3f} ms{extra}', file=output)
+    return results
+
+
+def environment() -> dict:
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'platform': platform.platform()}
+
+
+def save(results: Dict[str, dict], path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path: str) -> Dict[str, dict]:
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def machine_speed(results: Dict[str, dict]) -> Optional[float]:
+    """
+    Returns the median calibration time of a run, or None for results saved
+    without calibration
+    """
+    calibrations = [result['calibration'] for result in results.values() if 'calibration' in result]
+    return statistics.median(calibrations) if calibrations else None
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = DEFAULT_THRESHOLD,
+            output=sys.stdout) -> List[str]:
+    """
+    Prints the change of every benchmark relative to the baseline and returns
+    the keys of the benchmarks that regressed. Baseline times are scaled by the
+    difference in machine speed between the two runs when both have one.
+    """
+    scale = 1.0
+    if machine_speed(results) and machine_speed(baseline):
+        scale = machine_speed(results) / machine_speed(baseline)
+
+    regressions = []
+    print(f"{'benchmark':<32} {'baseline':>12} {'current':>12} {'change':>8}", file=output)
+    for key, result in results.items():
+        if key not in baseline:
+            print(f'{key:<32} {"-":>12} {result["seconds"] * 1e3:>9.3f} ms {"new":>8}', file=output)
+            continue
+        before = baseline[key]
+        change = result['seconds'] / (before['seconds'] * scale) - 1
+        regressed = change > threshold
+        notes = ''
+        if result.get('queries', 0) > before.get('queries', 0):
+            regressed = True
+            notes = f' queries {before.get("queries", 0)} -> {result["queries"]}'
+        if regressed:
+            regressions.append(key)
+        print(f'{key:<32} {before["seconds"] * 1e3:>9.3f} ms {result["seconds"] * 1e3:>9.3f} ms '
+              f'{change:>+7.1%}{" REGRESSION" if regressed else ""}{notes}', file=output)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('run', 'save', 'compare'))
+    parser.add_argument('results', nargs='?', help='compare these saved results instead of running the suite')
+    parser.add_argument('-k', '--filter', default='', help='only run benchmarks whose name/size contains this')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed slowdown as a fraction of the baseline time (default: 0.5)')
+    args = parser.parse_args()
+
+    if args.command == 'compare' and args.results:
+        results = load(args.results)
+    else:
+        results = run(args.filter)
+
+    if args.output:
+        save(results, args.output)
+    if args.command == 'save':
+        save(results, args.baseline)
+        print(f'[+] Saved baseline to {args.baseline}')
+    elif args.command == 'compare':
+        baseline = load(args.baseline)
+        if not args.results:
+            for _ in range(2):
+                with open(os.devnull, 'w') as devnull:
+                    flagged = compare(results, baseline, args.threshold, devnull)
+                if not flagged:
+                    break
+                print(f'[*] Re-running {len(flagged)} flagged benchmark(s)')
+                for key, result in run(keys=flagged).items():
+                    if result['seconds'] < results[key]['seconds']:
+                        results[key] = result
+
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'[-] {len(regressions)} regression(s) past {args.threshold:.0%}: {", ".join(regressions)}')
+            sys.exit(1)
+        print('[+] No regressions')
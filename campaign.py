@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Byte-at-a-time attack campaigns against many targets at once
+
+chal12 and chal14 attack a single oracle from start to finish. A Campaign runs
+the same attack against many independent targets on asyncio, each with its
+own key, secret and rate limit, and decides which target gets to make the next
+step of progress.
+
+An attack is split into steps: a probe that finds the block size and prefix
+length (as chal14.Oracle.detect_block_size does), then one step per recovered
+byte, which is the 256 dictionary queries plus the matching query of
+chal14.decrypt_secret. The dictionary queries of a step are sent concurrently.
+
+Scheduling:
+- Up to max_concurrent steps run at once, at most one per target.
+- Ready targets are started in order of priority: recovered bytes per query
+  so far, times the target's weight. Targets that haven't made any queries
+  yet go first.
+- Each target has an optional query budget and the campaign has a global
+  one. A step only starts if both budgets can cover its worst case cost,
+  and whatever it didn't use is released when it finishes.
+- Each target has an optional rate limit in queries per second.
+- A step that raises or takes longer than step_timeout puts its target on
+  exponential back-off. After max_failures failures in a row the target is
+  given up on. The bytes of a failed step are not kept, so it is simply
+  repeated.
+
+status() returns the aggregate throughput and the progress of every target,
+and can be called at any time, e.g. from another task while run() is going.
+"""
+
+import asyncio
+import inspect
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+
+PROBE_COST = 64
+# The dictionary for the next byte plus the query it is matched against
+BYTE_COST = 257
+
+PENDING = 'pending'
+RUNNING = 'running'
+BACKOFF = 'backoff'
+DONE = 'done'
+FAILED = 'failed'
+EXHAUSTED = 'exhausted'
+
+
+class Budget:
+    """
+    A query budget. Queries are reserved before a step starts and the unused
+    part of the reservation is released when it ends. A limit of None is
+    unlimited.
+    """
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.used = 0
+        self.reserved = 0
+
+    @property
+    def remaining(self) -> Optional[int]:
+        return None if self.limit is None else self.limit - self.used - self.reserved
+
+    def can_reserve(self, queries: int) -> bool:
+        return self.limit is None or self.remaining >= queries
+
+    def reserve(self, queries: int):
+        self.reserved += queries
+
+    def settle(self, reserved: int, used: int):
+        self.reserved -= reserved
+        self.used += used
+
+
+class RateLimiter:
+    """
+    Token bucket allowing rate queries per second, in bursts of up to burst
+    queries
+    """
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Target:
+    """
+    One oracle under attack. oracle.encrypt may be a plain function or a
+    coroutine function.
+    """
+    def __init__(self, name: str, oracle, budget: Optional[int] = None, rate_limit: Optional[float] = None,
+                 weight: float = 1.0):
+        self.name = name
+        self.oracle = oracle
+        self.budget = Budget(budget)
+        self.limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.weight = weight
+        self.is_async = inspect.iscoroutinefunction(oracle.encrypt)
+
+        self.state = PENDING
+        self.block_size: Optional[int] = None
+        self.prefix_length: Optional[int] = None
+        self.known = b''
+        self.queries = 0
+        self.steps = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.retry_at = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def priority(self) -> float:
+        if not self.queries:
+            return float('inf')
+        return self.weight * len(self.known) / self.queries
+
+    @property
+    def step_cost(self) -> int:
+        return PROBE_COST if self.block_size is None else BYTE_COST
+
+    def to_dict(self) -> dict:
+        return {
+            'state': self.state,
+            'recovered': len(self.known),
+            'queries': self.queries,
+            'steps': self.steps,
+            'budget_remaining': self.budget.remaining,
+            'bytes_per_query': len(self.known) / self.queries if self.queries else 0.0,
+            'block_size': self.block_size,
+            'prefix_length': self.prefix_length,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }
+
+
+class StepQueries:
+    """
+    Sends the queries of one step, charging them to the target
+    """
+    def __init__(self, campaign: 'Campaign', target: Target):
+        self.campaign = campaign
+        self.target = target
+        self.used = 0
+
+    async def __call__(self, plaintext: bytes) -> bytes:
+        target = self.target
+        if target.limiter is not None:
+            await target.limiter.acquire()
+        self.used += 1
+        target.queries += 1
+        self.campaign.queries += 1
+        if target.is_async:
+            return await target.oracle.encrypt(plaintext)
+        return target.oracle.encrypt(plaintext)
+
+
+async def probe(query: StepQueries) -> tuple:
+    """
+    Returns the prefix length and block size of the target, found the same way
+    as chal14.Oracle.detect_block_size: by growing the input until the first
+    block stops changing
+    """
+    last_ct = b''
+    for i in range(1, PROBE_COST):
+        ct = await query(b'A' * i)
+        if last_ct[:4] == ct[:4]:
+            for j in range(PROBE_COST):
+                if last_ct[j] != ct[j]:
+                    return (j - i) + 1, j
+            raise ValueError("Found matching block but failed to get block size")
+        last_ct = ct
+    raise ValueError("Failed to find matching block")
+
+
+async def recover_byte(query: StepQueries, block_size: int, prefix_length: int, known: bytes) -> Optional[bytes]:
+    """
+    Recovers the byte after known, or returns None once the padding is
+    reached. The same arithmetic as chal14.decrypt_secret.
+    """
+    current_block = (len(known) + prefix_length) // block_size + 1
+    filler = b'A' * ((block_size * current_block) - prefix_length - len(known) - 1)
+    start, end = block_size * (current_block - 1), block_size * current_block
+
+    candidates = [bytes([i]) for i in range(256)]
+    ciphertexts = await asyncio.gather(*(query(filler + known + c) for c in candidates), query(filler))
+    dictionary = {ct[start:end]: c for ct, c in zip(ciphertexts, candidates)}
+    next_char = dictionary[ciphertexts[-1][start:end]]
+    # A lone \x01 is the PKCS#7 padding of a secret that ends here
+    return None if next_char == b'\x01' else next_char
+
+
+class Campaign:
+    def __init__(self, targets: List[Target], budget: Optional[int] = None, max_concurrent: int = 8,
+                 step_timeout: float = 10.0, backoff: float = 0.5, max_backoff: float = 30.0,
+                 max_failures: int = 5, on_byte: Optional[Callable[[Target], None]] = None):
+        self.targets = {target.name: target for target in targets}
+        self.budget = Budget(budget)
+        self.max_concurrent = max_concurrent
+        self.step_timeout = step_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        self.on_byte = on_byte
+
+        self.queries = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    async def step(self, target: Target, query: StepQueries):
+        if target.block_size is None:
+            target.prefix_length, target.block_size = await probe(query)
+            return
+        next_char = await recover_byte(query, target.block_size, target.prefix_length, target.known)
+        if next_char is None:
+            target.state = DONE
+        else:
+            target.known += next_char
+            if self.on_byte is not None:
+                self.on_byte(target)
+
+    def ready_targets(self, now: float) -> List[Target]:
+        ready = []
+        for target in self.targets.values():
+            if target.state == BACKOFF and target.retry_at <= now:
+                target.state = PENDING
+            if target.state != PENDING:
+                continue
+            cost = target.step_cost
+            if not target.budget.can_reserve(cost):
+                target.state = EXHAUSTED
+                target.last_error = 'target budget exhausted'
+            elif self.budget.can_reserve(cost):
+                ready.append(target)
+        return sorted(ready, key=lambda target: (-target.priority, target.queries))
+
+    def finish_step(self, target: Target, query: StepQueries, reserved: int, error: Optional[BaseException]):
+        target.budget.settle(reserved, query.used)
+        self.budget.settle(reserved, query.used)
+        target.steps += 1
+
+        if error is None:
+            target.consecutive_failures = 0
+            if target.state == RUNNING:
+                target.state = PENDING
+            return
+
+        target.failures += 1
+        target.consecutive_failures += 1
+        if isinstance(error, asyncio.TimeoutError):
+            target.last_error = f'step timed out after {self.step_timeout}s'
+        else:
+            target.last_error = f'{type(error).__name__}: {error}'
+        if target.consecutive_failures >= self.max_failures:
+            target.state = FAILED
+        else:
+            target.state = BACKOFF
+            delay = min(self.max_backoff, self.backoff * 2 ** (target.consecutive_failures - 1))
+            target.retry_at = time.monotonic() + delay
+
+    async def run(self) -> Dict[str, bytes]:
+        """
+        Runs until every target is done, failed or out of budget, and returns
+        the bytes recovered from each target
+        """
+        self.started = time.monotonic()
+        running: Dict[asyncio.Task, tuple] = {}
+
+        while True:
+            now = time.monotonic()
+            for target in self.ready_targets(now):
+                if len(running) >= self.max_concurrent:
+                    break
+                cost = target.step_cost
+                if not self.budget.can_reserve(cost):
+                    continue
+                target.budget.reserve(cost)
+                self.budget.reserve(cost)
+                target.state = RUNNING
+                query = StepQueries(self, target)
+                task = asyncio.ensure_future(asyncio.wait_for(self.step(target, query), self.step_timeout))
+                running[task] = (target, query, cost)
+
+            if not running:
+                waiting = [target.retry_at for target in self.targets.values() if target.state == BACKOFF]
+                if not waiting:
+                    break
+                await asyncio.sleep(max(0.0, min(waiting) - now))
+                continue
+
+            # Wake up for finished steps, or when a target comes off back-off
+            retries = [target.retry_at - now for target in self.targets.values() if target.state == BACKOFF]
+            done, _ = await asyncio.wait(running, timeout=max(0.0, min(retries)) if retries else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                target, query, cost = running.pop(task)
+                self.finish_step(target, query, cost, task.exception())
+
+        # Targets still waiting for a step have run out of global budget
+        for target in self.targets.values():
+            if target.state == PENDING:
+                target.state = EXHAUSTED
+                target.last_error = 'campaign budget exhausted'
+        self.finished = time.monotonic()
+        return {name: target.known for name, target in self.targets.items()}
+
+    def status(self) -> dict:
+        end = self.finished or time.monotonic()
+        elapsed = end - self.started if self.started else 0.0
+        recovered = sum(len(target.known) for target in self.targets.values())
+        states = {}
+        for target in self.targets.values():
+            states[target.state] = states.get(target.state, 0) + 1
+        return {
+            'elapsed': elapsed,
+            'queries': self.queries,
+            'budget_remaining': self.budget.remaining,
+            'recovered': recovered,
+            'queries_per_second': self.queries / elapsed if elapsed else 0.0,
+            'bytes_per_second': recovered / elapsed if elapsed else 0.0,
+            'states': states,
+            'targets': {name: target.to_dict() for name, target in self.targets.items()},
+        }
+
+    def status_json(self, **kwargs) -> str:
+        return json.dumps(self.status(), **kwargs)
+
+
+def print_status(status: dict):
+    print(f"[*] {status['elapsed']:.1f}s: {status['recovered']} bytes, {status['queries']} queries, "
+          f"{status['queries_per_second']:,.0f} queries/s, {status['bytes_per_second']:.1f} B/s, {status['states']}")
+
+
+if __name__ == '__main__':
+    import random
+
+    from chal12 import Oracle as SimpleOracle
+    from chal14 import Oracle as PrefixOracle
+    from corpus_gen import EnglishText
+
+    class RemoteOracle:
+        """
+        Stands in for a target behind the network: each query takes latency
+        seconds and fails with probability error_rate
+        """
+        def __init__(self, oracle, latency: float = 0.001, error_rate: float = 0.0, seed: int = 0):
+            self.oracle = oracle
+            self.latency = latency
+            self.error_rate = error_rate
+            self.rng = random.Random(seed)
+
+        async def encrypt(self, plaintext: bytes) -> bytes:
+            await asyncio.sleep(self.latency)
+            if self.rng.random() < self.error_rate:
+                raise ConnectionError('connection reset by target')
+            return self.oracle.encrypt(plaintext)
+
+    text = EnglishText(random.Random(1))
+    secrets = {}
+    targets = []
+    for i in range(12):
+        oracle = SimpleOracle() if i % 2 else PrefixOracle()
+        name = f'{"chal12" if i % 2 else "chal14"}-{i}'
+        secrets[name] = oracle.core.suffix = text.read(random.Random(i).randint(24, 64))
+        if i < 4:
+            # Local oracles, answered inline
+            targets.append(Target(name, oracle))
+        elif i < 10:
+            targets.append(Target(name, RemoteOracle(oracle, error_rate=0.0005 if i == 5 else 0.0, seed=i),
+                                  rate_limit=5000))
+        elif i == 10:
+            # Too slow for the step timeout, ends up failed
+            targets.append(Target(name, RemoteOracle(oracle), rate_limit=100))
+        else:
+            # Runs out of its own budget partway through the secret
+            targets.append(Target(name, oracle, budget=PROBE_COST + 10 * BYTE_COST))
+
+    campaign = Campaign(targets, step_timeout=1.0, backoff=0.1, max_failures=3)
+
+    async def main():
+        async def report():
+            while True:
+                await asyncio.sleep(0.5)
+                print_status(campaign.status())
+
+        reporter = asyncio.ensure_future(report())
+        try:
+            return await campaign.run()
+        finally:
+            reporter.cancel()
+
+    results = asyncio.run(main())
+    status = campaign.status()
+    print_status(status)
+    for name, target in status['targets'].items():
+        correct = results[name] == secrets[name][:len(results[name])]
+        print(f"[+] {name:<10} {target['state']:<9} {target['recovered']:>3}/{len(secrets[name])} bytes "
+              f"{target['queries']:>6} queries  {'correct' if correct else 'WRONG'}"
+              + (f"  ({target['last_error']})" if target['last_error'] else ''))
+        assert correct
+        assert target['state'] != DONE or results[name] == secrets[name]
+
+    # A global budget stops the whole campaign
+    targets = [Target(f'chal12-{i}', SimpleOracle()) for i in range(4)]
+    campaign = Campaign(targets, budget=4 * PROBE_COST + 20 * BYTE_COST)
+    asyncio.run(campaign.run())
+    status = campaign.status()
+    print(f"[+] Global budget of {campaign.budget.limit} queries: {status['queries']} used, "
+          f"{status['recovered']} bytes, {status['states']}")
+    assert status['queries'] <= campaign.budget.limit
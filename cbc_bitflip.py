@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+CBC bitflip payload planner
+
+chal16 injects ';admin=true;' by XORing 0x41 into the ciphertext block right
+before the user data, which only works because the prefix is exactly two
+blocks long. The planner works from the layout of the encoder instead:
+
+- the prefix length is found by encoding two different inputs and seeing
+  where they differ
+- the user data starts with filler up to the next block boundary, so no
+  prefix block is ever scrambled
+- every target block is preceded by a sacrificial filler block. Flipping bits
+  in the sacrificial block's ciphertext scrambles its own plaintext and
+  applies the same flips to the target block.
+
+The user data is filler only, so the encoder never sees a ';' or '=' to quote
+out. A flip mask is just filler XOR target, placed one block earlier. Every
+plan with the same user data can reuse one create() query, so thousands of
+payload variants need a single ciphertext.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence, Tuple
+
+
+# (offset into the user data, bytes to place there)
+Injection = Tuple[int, bytes]
+
+
+@dataclass
+class Plan:
+    userdata: str
+    injections: List[Injection]
+    # XOR mask for the start of the ciphertext
+    mask: bytes
+
+    def apply(self, ciphertext: bytes) -> bytes:
+        """
+        Flips the planned bits in a ciphertext of the plan's user data
+        """
+        length = len(self.mask)
+        if len(ciphertext) < length:
+            raise ValueError("Ciphertext is shorter than the plan")
+        flipped = int.from_bytes(ciphertext[:length], 'big') ^ int.from_bytes(self.mask, 'big')
+        return flipped.to_bytes(length, 'big') + ciphertext[length:]
+
+
+class BitflipPlanner:
+    def __init__(self, prefix_length: int, block_size: int = 16, filler: str = 'A'):
+        if len(filler) != 1:
+            raise ValueError("Filler must be a single character")
+        self.prefix_length = prefix_length
+        self.block_size = block_size
+        self.filler = filler
+        self.filler_byte = ord(filler)
+        # The first user data block that starts on a block boundary
+        self.first_block = -(-prefix_length // block_size)
+        self.alignment = self.first_block * block_size - prefix_length
+
+    @classmethod
+    def from_encoder(cls, encode: Callable[[str], str], block_size: int = 16, filler: str = 'A') -> 'BitflipPlanner':
+        """
+        Finds the prefix length of encode (e.g. chal16.add_comments_and_quote)
+        and checks that it leaves the filler alone
+        """
+        prefix_length = len(os.path.commonprefix([encode('X'), encode('Y')]))
+        run = filler * (2 * block_size)
+        if encode(run)[prefix_length:prefix_length + len(run)] != run:
+            raise ValueError(f"Encoder doesn't pass {filler!r} through unchanged")
+        return cls(prefix_length, block_size, filler)
+
+    def place(self, targets: Sequence[bytes]) -> List[Injection]:
+        """
+        Places each target at the start of its own block, after a
+        sacrificial block
+        """
+        bs = self.block_size
+        injections = []
+        offset = self.alignment
+        for target in targets:
+            if len(target) > bs:
+                raise ValueError(f"Target doesn't fit in one block: {target!r}")
+            injections.append((offset + bs, target))
+            offset += 2 * bs
+        return injections
+
+    def plan(self, injections: Sequence[Injection]) -> Plan:
+        """
+        Works out the flip mask for the injections. Raises ValueError if an
+        injection would need a block scrambled that lies before the user data or
+        another injection.
+        """
+        bs = self.block_size
+        start = self.prefix_length
+
+        # The user data is filler up to the end of the last target block, so
+        # all plans for the same number of blocks share their user data
+        end = max((start + offset + len(text) for offset, text in injections), default=start)
+        length = -(-end // bs) * bs - start
+
+        mask = bytearray(max(0, -(-end // bs) - 1) * bs)
+        targets = set()
+        flipped = set()
+        for offset, text in injections:
+            if offset < 0:
+                raise ValueError(f"Negative offset: {offset}")
+            for i, value in enumerate(text):
+                position = start + offset + i
+                targets.add(position // bs)
+                delta = value ^ self.filler_byte
+                if delta:
+                    if position // bs - 1 < self.first_block:
+                        raise ValueError(f"Injection at {offset} would scramble a block before the user data")
+                    flipped.add(position // bs - 1)
+                    mask[position - bs] ^= delta
+
+        for block in flipped:
+            if block in targets:
+                raise ValueError(f"Injection would scramble block {block}, which holds another injection")
+
+        return Plan(self.filler * length, list(injections), bytes(mask))
+
+    def plan_targets(self, targets: Sequence[bytes]) -> Plan:
+        return self.plan(self.place(targets))
+
+    def craft(self, create: Callable[[str], bytes], plans: Sequence[Plan]) -> List[bytes]:
+        """
+        Returns a crafted ciphertext for every plan, with one create() query
+        per distinct user data
+        """
+        ciphertexts: Dict[str, bytes] = {}
+        crafted = []
+        for plan in plans:
+            if plan.userdata not in ciphertexts:
+                ciphertexts[plan.userdata] = create(plan.userdata)
+            crafted.append(plan.apply(ciphertexts[plan.userdata]))
+        return crafted
+
+
+if __name__ == '__main__':
+    import time
+
+    from chal16 import Cipher, add_comments_and_quote
+
+    planner = BitflipPlanner.from_encoder(add_comments_and_quote)
+    print(f'[+] Prefix length: {planner.prefix_length}')
+
+    queries = 0
+
+    def create(data: str) -> bytes:
+        global queries
+        queries += 1
+        return cipher.create(data)
+
+    cipher = Cipher()
+    plan = planner.plan_targets([b';admin=true;'])
+    crafted, = planner.craft(create, [plan])
+    print(f'[+] Decrypted crafted ciphertext: {cipher.decrypt(crafted)}')
+    assert cipher.is_admin(crafted)
+
+    # Several injections at once, at explicit offsets
+    plan = planner.plan([(32, b';admin=true;'), (80, b';role=root;')])
+    plaintext = cipher.decrypt(planner.craft(create, [plan])[0])
+    assert b';admin=true;' in plaintext and b';role=root;' in plaintext
+    print(f'[+] Two injections: {plaintext}')
+
+    try:
+        planner.plan([(0, b';admin=true;')])
+    except ValueError as e:
+        print(f'[+] Rejected: {e}')
+
+    # Thousands of variants from a single ciphertext
+    variants = [[f';admin=true;u={i:04}'[:16].encode(), b';role=root;'] for i in range(5000)]
+    start = time.perf_counter()
+    plans = [planner.plan_targets(targets) for targets in variants]
+    elapsed = time.perf_counter() - start
+    print(f'[+] Planned {len(plans)} variants in {elapsed * 1000:.1f} ms')
+
+    queries = 0
+    crafted = planner.craft(create, plans)
+    assert cipher.is_admin_batch(crafted).all()
+    print(f'[+] {len(crafted)} crafted admin cookies from {queries} create() query')
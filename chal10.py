@@ -18,9 +18,8 @@ The file here is intelligible (somewhat) when CBC decrypted against "YELLOW SUBM
 all ASCII 0 (\x00\x00\x00 &c)
 """
 
-from base64 import b64decode
-from Crypto.Cipher import AES
 from chal6 import get_chunks
+from profile_hooks import stage
 
 def xor_16(c1: bytes, c2: bytes) -> bytes:
     assert len(c1) == 16 and len(c2) == 16
@@ -29,9 +28,12 @@ def xor_16(c1: bytes, c2: bytes) -> bytes:
 
 class AES_CBC:
     def __init__(self, key: bytes, iv: bytes):
+        # pycryptodome is only loaded once a cipher is created
+        from Crypto.Cipher import AES
         self.cipher = AES.new(key, AES.MODE_ECB)
         self.iv = iv
 
+    @stage('chal10 cbc encrypt')
     def encrypt(self, plaintext: bytes) -> bytes:
         ciphertext = b''
         prev_block = self.iv
@@ -45,6 +47,7 @@ class AES_CBC:
         return ciphertext
 
 
+    @stage('chal10 cbc decrypt')
     def decrypt(self, ciphertext: bytes) -> bytes:
         plaintext = b''
         prev_block = self.iv
@@ -67,7 +70,7 @@ if __name__ == '__main__':
     decrypted = cipher.decrypt(ciphertext)
     assert plaintext == decrypted
 
-    with open('./files/10.txt') as f:
-        challenge_ciphertext = b64decode(f.read())
-    
+    import datasets
+    challenge_ciphertext = datasets.blob('10.txt')
+
     print(cipher.decrypt(challenge_ciphertext).decode())
@@ -25,38 +25,44 @@ or CBC, tells you which one is happening.
 - When the attacker controls the input, block ciphers can become compromised
 """
 
-import random
-
-from Crypto.Cipher import AES
+from typing import Tuple
 
 from chal8 import detect_aes_ecb
-from chal9 import pkcs7_pad
+from padding import pkcs7_pad
 from chal10 import AES_CBC
+from instrumentation import instrumented
+from oracle_core import rand_bytes, rand_int
 
 
-def rand_bytes(size: int = 16) -> bytes:
-    return bytes([random.randint(0, 255) for i in range(size)])
-
-
-def encryption_oracle(plaintext: bytes) -> bytes:
+def encrypt_random_mode(plaintext: bytes) -> Tuple[str, bytes]:
+    """
+    Encrypts under a random key with either ECB or CBC and returns the mode that
+    was used along with the ciphertext
+    """
+    from Crypto.Cipher import AES
     rand_key = rand_bytes()
-    if random.choice([0, 1]) == 0:
-        print('Using ECB')
+    if rand_int(0, 1) == 0:
+        mode = 'ECB'
         cipher = AES.new(rand_key, AES.MODE_ECB)
     else:
-        print('Using CBC')
+        mode = 'CBC'
         rand_iv = rand_bytes()
         cipher = AES_CBC(rand_key, rand_iv)
 
     # Append random bytes as instructed
     modified_plaintext = b''.join([
-        rand_bytes(random.randint(5, 10)),
+        rand_bytes(rand_int(5, 10)),
         plaintext,
-        rand_bytes(random.randint(5, 10))
+        rand_bytes(rand_int(5, 10))
     ])
 
     # Make sure the data is properly padded for the block cipher
-    return cipher.encrypt(pkcs7_pad(modified_plaintext, 16))
+    return mode, cipher.encrypt(pkcs7_pad(modified_plaintext, 16))
+
+
+@instrumented
+def encryption_oracle(plaintext: bytes) -> bytes:
+    return encrypt_random_mode(plaintext)[1]
 
 
 def detect_cipher(ciphertext: bytes) -> str:
@@ -66,9 +72,12 @@ def detect_cipher(ciphertext: bytes) -> str:
         result = 'CBC'
 
     print(f'Detected {result}')
+    return result
 
 
 if __name__ == '__main__':
     # Encrypt a message long enough to create repeating blocks or detection
     # mechanism will not work
-    detect_cipher(encryption_oracle(b"A" * 64))
+    mode, ciphertext = encrypt_random_mode(b"A" * 64)
+    print(f'Using {mode}')
+    detect_cipher(ciphertext)
@@ -40,35 +40,26 @@ discovered the first byte of unknown-string. Repeat for the next byte.
 - How to use the known plaintext to create dictionaries for blocks after the first
 """
 
-import random
-from base64 import b64decode
-
-from Crypto.Cipher import AES
+import sys
+import threading
+from typing import Iterator, Optional
 
 from chal8 import detect_aes_ecb
-from chal9 import pkcs7_pad
-
+from instrumentation import InstrumentedMixin, ProgressReporter, QueryBudgetExceeded, instrumented, print_progress
+from journal import Journal, JournaledOracle
+from oracle_core import SECRET_SUFFIX, ECBOracleCore, rand_bytes
+from profile_hooks import stage
 
-def rand_bytes(size: int = 16) -> bytes:
-    return bytes([random.randint(0, 255) for i in range(size)])
 
+class Oracle(InstrumentedMixin):
+    def __init__(self, key: bytes = None):
+        # AES ECB with a consistent but unknown key. The secret is decoded once
+        # by oracle_core and appended to every plaintext as instructed
+        self.core = ECBOracleCore(key, suffix=SECRET_SUFFIX)
 
-class Oracle:
-    def __init__(self):
-        # AES ECB with a consistent but unknown key
-        self.cipher = AES.new(rand_bytes(), AES.MODE_ECB)
-
+    @instrumented
     def encrypt(self, plaintext: bytes) -> bytes:
-        # Append random bytes as instructed
-        plaintext += b64decode("""
-        Um9sbGluJyBpbiBteSA1LjAKV2l0aCBteSByYWctdG9wIGRvd24gc28gbXkg
-        aGFpciBjYW4gYmxvdwpUaGUgZ2lybGllcyBvbiBzdGFuZGJ5IHdhdmluZyBq
-        dXN0IHRvIHNheSBoaQpEaWQgeW91IHN0b3A/IE5vLCBJIGp1c3QgZHJvdmUg
-        YnkK                         
-        """)
-
-        # Make sure the data is properly padded for the block cipher
-        return self.cipher.encrypt(pkcs7_pad(plaintext, 16))
+        return self.core.encrypt(plaintext)
 
     def detect_block_size(self) -> int:
         """
@@ -92,6 +83,19 @@ class Oracle:
         else:
             raise ValueError("Failed to find matching block")
 
+    def detect_secret_length(self) -> int:
+        """
+        Grows the input one byte at a time until the ciphertext gets a block
+        longer. At that point the input has filled the last block exactly, so
+        the secret is the original ciphertext length minus the input length.
+        """
+        base_length = len(self.encrypt(b''))
+        for i in range(1, 257):
+            if len(self.encrypt(b'A' * i)) > base_length:
+                return base_length - i
+        raise ValueError("Ciphertext length never changed")
+
+    @stage('chal12 dictionary build')
     def create_dictionary(self, block_size: int, current_block: int, known_plaintext: bytes) -> dict:
         """
         Given a block size, creates a dictionary of all the possible block
@@ -111,31 +115,110 @@ class Oracle:
         return dictionary
 
 
-if __name__ == '__main__':
-    oracle = Oracle()
-    block_size = oracle.detect_block_size()
-    assert detect_aes_ecb(oracle.encrypt(b'A' * (block_size * 3)))
-
-    # Decrypt the plaintext one block at a time. Each time we uncover a block,
-    # Pad it out to the next block over and repeat the process, solving a char
-    # at a time.
-    known_plaintext = b''
-    current_block = 1
-    while True:
-        dictionary = oracle.create_dictionary(block_size, current_block, known_plaintext)
+def iter_secret(oracle, block_size: int, known_plaintext: bytes = b'', secret_length: Optional[int] = None,
+                max_queries: Optional[int] = None, cancel: Optional[threading.Event] = None) -> Iterator[bytes]:
+    """
+    Yields the bytes of the secret suffix after known_plaintext one at a time,
+    as soon as each is recovered.
+
+    The attack stops after exactly secret_length bytes, which is probed from
+    the ciphertext length if not given. It raises QueryBudgetExceeded instead
+    of starting a byte it can't pay for out of max_queries, and returns early
+    once cancel is set. Closing the generator stops the attack as well.
+    """
+    metrics = oracle.metrics
+    queries = 0
+    if secret_length is None:
+        with metrics.phase('length probe'):
+            start = metrics.calls
+            secret_length = oracle.detect_secret_length()
+            queries += metrics.calls - start
+
+    known = bytearray(known_plaintext)
+    while len(known) < secret_length:
+        if cancel is not None and cancel.is_set():
+            return
+        # The dictionary plus the query it is matched against
+        if max_queries is not None and queries + 257 > max_queries:
+            raise QueryBudgetExceeded(
+                f"Recovered {len(known)} of {secret_length} bytes with {queries} of {max_queries} queries")
+
+        current_block = len(known) // block_size + 1
+        with metrics.phase('dictionary build'):
+            dictionary = oracle.create_dictionary(block_size, current_block, bytes(known))
 
         # Solve next plaintext char
-        plaintext = b'A' * ((block_size * current_block) - len(known_plaintext) - 1)
-        ciphertext = oracle.encrypt(plaintext)
-        block = ciphertext[block_size * (current_block - 1):block_size * current_block]
-        next_char = dictionary[block]
-        if next_char == b'\x04':
-            # Reached pkcs7 padding. Done.
-            break
+        plaintext = b'A' * ((block_size * current_block) - len(known) - 1)
+        with metrics.phase('match'):
+            ciphertext = oracle.encrypt(plaintext)
+        queries += 257
+        next_char = dictionary[ciphertext[block_size * (current_block - 1):block_size * current_block]]
+        known += next_char
+        yield next_char
+
+
+def decrypt_secret(oracle, block_size: int, known_plaintext: bytes = b'', journal=None,
+                   progress: ProgressReporter = None, **kwargs) -> bytes:
+    """
+    Decrypts the secret suffix one byte at a time with iter_secret, which
+    takes the remaining keyword arguments. Decryption resumes after
+    known_plaintext, and every recovered byte is saved to the journal if one is
+    given so that an interrupted run can pick up where it left off.
+    """
+    known = bytearray(known_plaintext)
+    for next_char in iter_secret(oracle, block_size, known_plaintext, **kwargs):
+        known += next_char
+        if journal is not None:
+            journal.save_progress(bytes(known))
+        if progress is not None and len(known) % block_size == 0:
+            progress.update(len(known))
+
+    return bytes(known)
 
-        known_plaintext += next_char
-        if len(known_plaintext) % block_size == 0:
-            # Reached the end of the current block
-            current_block += 1
 
+if __name__ == '__main__':
+    # Usage: chal12.py [journal.db]
+    # With a journal, the oracle uses a fixed key as a stand-in for a remote
+    # target whose key doesn't change between runs, and a restarted attack
+    # resumes from the last recovered byte.
+    journal = None
+    if len(sys.argv) > 1:
+        # The target name changes whenever the oracle's output does, as it did
+        # with the switch to real PKCS#7 padding, so stale journals are ignored
+        journal = Journal(sys.argv[1], target='chal12-pkcs7')
+        oracle = JournaledOracle(Oracle(key=b'YELLOW SUBMARINE'), journal)
+    else:
+        oracle = Oracle()
+
+    metrics = oracle.metrics
+
+    with metrics.phase('block-size detection'):
+        block_size = oracle.detect_block_size()
+    with metrics.phase('ecb detection'):
+        assert detect_aes_ecb(oracle.encrypt(b'A' * (block_size * 3)))
+    with metrics.phase('length probe'):
+        secret_length = oracle.detect_secret_length()
+    print(f'[+] Secret length: {secret_length}')
+    progress = ProgressReporter(print_progress, total=secret_length, metrics=metrics)
+
+    known_plaintext = journal.load_progress() if journal else b''
+    if known_plaintext:
+        print(f'[+] Resuming after {len(known_plaintext)} recovered bytes')
+
+    known_plaintext = decrypt_secret(oracle, block_size, known_plaintext, journal, progress,
+                                     secret_length=secret_length)
     print(known_plaintext)
+    print(metrics.to_json(indent=2))
+    if journal:
+        print(f'[+] Journal hits: {journal.hits}, misses: {journal.misses}')
+        journal.close()
+
+    # Consumers can use the secret while it is still being recovered, and stop
+    # the attack when they have what they need, e.g. the first line
+    oracle = Oracle()
+    first_line = bytearray()
+    for next_char in iter_secret(oracle, block_size):
+        first_line += next_char
+        if next_char == b'\n':
+            break
+    print(f'[+] Streamed the first line with {oracle.metrics.calls} queries: {bytes(first_line)}')
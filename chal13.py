@@ -45,65 +45,54 @@ ciphertexts themselves, make a role=admin profile.
   lessened.
 """
 
-import random
-from urllib.parse import parse_qsl, urlencode
-
-from Crypto.Cipher import AES
-
-from chal9 import pkcs7_pad
+from padding import pkcs7_pad, pkcs7_strip
+from cookie_codec import encode_profile, parse_cookie
+from instrumentation import InstrumentedMixin, instrumented
+from oracle_core import rand_bytes
 
 
 def parse_url_encoding(data: bytes) -> dict:
     """
     Given a URL-encoded string, parses it into a dictionary
     """
-    return {
-        k.decode(): v.decode() 
-        for k,v in parse_qsl(data)
-    }
+    return parse_cookie(data)
 
 
 def profile_for(email: str) -> str:
     """
-    Generates a user profile object for the given email address
+    Generates a user profile object for the given email address. The encoder
+    rejects & and = characters.
     """
-    # Reject & and = characters
-    if '&' in email or '=' in email:
-        raise ValueError(f'Invalid email address: {email}')
-
-    profile = {
-        'email': email,
-        'uid': '10',
-        'role': 'user'
-    }
-
-    # Url encode the profile object, but don't encode the '@' character.
-    return '&'.join(['='.join((k, v)) for k, v in profile.items()])
-    return urlencode(profile).replace('%40', '@').replace('%04')
+    return encode_profile(email)
 
 
-def rand_bytes(size: int = 16) -> bytes:
-    return bytes([random.randint(0, 255) for i in range(size)])
-
-
-class Oracle:
+class Oracle(InstrumentedMixin):
     def __init__(self):
         # AES ECB with a consistent but unknown key
+        from Crypto.Cipher import AES
         self.cipher = AES.new(rand_bytes(), AES.MODE_ECB)
 
+    @instrumented
     def encrypt(self, plaintext: bytes) -> bytes:
         # Make sure the data is properly padded for the block cipher
         return self.cipher.encrypt(pkcs7_pad(plaintext, 16))
 
+    @instrumented
     def decrypt(self, ciphertext: bytes) -> bytes:
         return self.cipher.decrypt(ciphertext)
 
+    def decrypt_profile(self, ciphertext: bytes) -> dict:
+        """
+        Decrypts, strips the PKCS#7 padding and parses a profile cookie
+        """
+        return parse_url_encoding(pkcs7_strip(self.decrypt(ciphertext)))
+
 
 if __name__ == '__main__':
     oracle = Oracle()
     user_profile = profile_for('foo@bar.com')
     profile_ct = oracle.encrypt(user_profile.encode())
-    profile_obj = parse_url_encoding(oracle.decrypt(profile_ct).rstrip(b'\x04'))
+    profile_obj = oracle.decrypt_profile(profile_ct)
     assert profile_obj == {'email': 'foo@bar.com', 'uid': '10', 'role': 'user'}
 
     # The target uses AES ECB, which will encrypt the data in 16B blocks. We
@@ -131,7 +120,7 @@ if __name__ == '__main__':
     role = 'admin'
     admin_plaintext = 'B' * (16 - len('email='))
     admin_plaintext += role
-    admin_plaintext += '\x04' * (16 - len(role))
+    admin_plaintext += chr(16 - len(role)) * (16 - len(role))
 
     crafted_admin_profile = profile_for(admin_plaintext + '@a.com')
     print('[+] Created profile object with padded block containing "admin" string:')
@@ -150,6 +139,5 @@ if __name__ == '__main__':
 
     # Decrypt and decode the crafted profile
     print('[+] Decrypted crafted profile object:')
-    crafted_profile_pt = oracle.decrypt(enc_crafted_profile).rstrip(b'\x04')
-    crafted_profile_obj = parse_url_encoding(crafted_profile_pt)
+    crafted_profile_obj = oracle.decrypt_profile(enc_crafted_profile)
     print(crafted_profile_obj)
@@ -14,39 +14,29 @@ Same goal: decrypt the target-bytes.
     operations have to also take the discovered prefix length into account.
 """
 
-import random
-from base64 import b64decode
-from typing import Tuple
-
-from Crypto.Cipher import AES
+import sys
+import threading
+from collections import Counter
+from typing import Iterator, Optional, Sequence, Tuple
 
 from chal8 import detect_aes_ecb
-from chal9 import pkcs7_pad
-
+from instrumentation import InstrumentedMixin, ProgressReporter, QueryBudgetExceeded, instrumented, print_progress
+from journal import Journal, JournaledOracle
+from oracle_core import SECRET_SUFFIX, ECBOracleCore, rand_bytes, rand_int
+from profile_hooks import stage
 
-def rand_bytes(size: int = 16) -> bytes:
-    return bytes([random.randint(0, 255) for i in range(size)])
 
-
-class Oracle:
-    def __init__(self):
-        # AES ECB with a consistent but unknown key
-        self.cipher = AES.new(rand_bytes(), AES.MODE_ECB)
+class Oracle(InstrumentedMixin):
+    def __init__(self, key: bytes = None, random_prefix: bytes = None):
         # Generate a random prefix to be prepended to each encrypted message
-        self.random_prefix = rand_bytes(random.randint(1, 15))
+        self.random_prefix = random_prefix or rand_bytes(rand_int(1, 15))
+        # AES ECB with a consistent but unknown key. The target bytes are
+        # decoded once by oracle_core and appended as instructed
+        self.core = ECBOracleCore(key, prefix=self.random_prefix, suffix=SECRET_SUFFIX)
 
+    @instrumented
     def encrypt(self, plaintext: bytes) -> bytes:
-        # Append random bytes as instructed
-        target_bytes = b64decode("""
-        Um9sbGluJyBpbiBteSA1LjAKV2l0aCBteSByYWctdG9wIGRvd24gc28gbXkg
-        aGFpciBjYW4gYmxvdwpUaGUgZ2lybGllcyBvbiBzdGFuZGJ5IHdhdmluZyBq
-        dXN0IHRvIHNheSBoaQpEaWQgeW91IHN0b3A/IE5vLCBJIGp1c3QgZHJvdmUg
-        YnkK                         
-        """)
-        data = b''.join([self.random_prefix, plaintext, target_bytes])
-
-        # Make sure the data is properly padded for the block cipher
-        return self.cipher.encrypt(pkcs7_pad(data, 16))
+        return self.core.encrypt(plaintext)
 
     def detect_block_size(self) -> Tuple[int, int]:
         """
@@ -73,6 +63,20 @@ class Oracle:
         else:
             raise ValueError("Failed to find matching block")
 
+    def detect_secret_length(self, prefix_length: int) -> int:
+        """
+        Grows the input one byte at a time until the ciphertext gets a block
+        longer. At that point the prefix, input and secret fill the last block
+        exactly, so the secret is the original ciphertext length minus the
+        prefix and input lengths.
+        """
+        base_length = len(self.encrypt(b''))
+        for i in range(1, 257):
+            if len(self.encrypt(b'A' * i)) > base_length:
+                return base_length - i - prefix_length
+        raise ValueError("Ciphertext length never changed")
+
+    @stage('chal14 dictionary build')
     def create_dictionary(self, block_size: int, current_block: int, prefix_length: int, known_plaintext: bytes) -> dict:
         """
         Given a block size, creates a dictionary of all the possible block
@@ -92,37 +96,263 @@ class Oracle:
         return dictionary
 
 
-if __name__ == '__main__':
-    oracle = Oracle()
-    
-    # We know the block size is 16. So the value our detector gives us uncovers
-    # the length of the random prefix as 16 - block size
-    prefix_length, block_size = oracle.detect_block_size()
-    print(f'[+] Prefix length: {prefix_length}')
-    print(f'[+] Block size: {block_size}')
-    assert detect_aes_ecb(oracle.encrypt(b'A' * (block_size * 3)))
+def iter_secret(oracle, block_size: int, prefix_length: int, known_plaintext: bytes = b'',
+                secret_length: Optional[int] = None, max_queries: Optional[int] = None,
+                cancel: Optional[threading.Event] = None) -> Iterator[bytes]:
+    """
+    Yields the target bytes after known_plaintext one at a time, as soon as
+    each is recovered, taking the random prefix into account.
+
+    The attack stops after exactly secret_length bytes, which is probed from
+    the ciphertext length if not given. It raises QueryBudgetExceeded instead
+    of starting a byte it can't pay for out of max_queries, and returns early
+    once cancel is set. Closing the generator stops the attack as well.
+    """
+    metrics = oracle.metrics
+    queries = 0
+    if secret_length is None:
+        with metrics.phase('length probe'):
+            start = metrics.calls
+            secret_length = oracle.detect_secret_length(prefix_length)
+            queries += metrics.calls - start
 
     # Decrypt the plaintext one block at a time. Each time we uncover a block,
     # Pad it out to the next block over and repeat the process, solving a char
     # at a time.
-    known_plaintext = b''
-    current_block = 1
-    while True:
-        dictionary = oracle.create_dictionary(block_size, current_block, prefix_length, known_plaintext)
+    known = bytearray(known_plaintext)
+    while len(known) < secret_length:
+        if cancel is not None and cancel.is_set():
+            return
+        # The dictionary plus the query it is matched against
+        if max_queries is not None and queries + 257 > max_queries:
+            raise QueryBudgetExceeded(
+                f"Recovered {len(known)} of {secret_length} bytes with {queries} of {max_queries} queries")
+
+        current_block = (len(known) + prefix_length) // block_size + 1
+        with metrics.phase('dictionary build'):
+            dictionary = oracle.create_dictionary(block_size, current_block, prefix_length, bytes(known))
 
         # Solve next plaintext char
-        plaintext = b'A' * ((block_size * current_block) - prefix_length - len(known_plaintext) - 1)
-        ciphertext = oracle.encrypt(plaintext)
-        block = ciphertext[block_size * (current_block - 1):block_size * current_block]
-        next_char = dictionary[block]
-        if next_char == b'\x04':
-            # Reached pkcs7 padding. Done.
-            break
-
-        known_plaintext += next_char
-        if (len(known_plaintext) + prefix_length) % block_size == 0:
-            # Reached the end of the current block
-            current_block += 1
+        plaintext = b'A' * ((block_size * current_block) - prefix_length - len(known) - 1)
+        with metrics.phase('match'):
+            ciphertext = oracle.encrypt(plaintext)
+        queries += 257
+        next_char = dictionary[ciphertext[block_size * (current_block - 1):block_size * current_block]]
+        known += next_char
+        yield next_char
+
+
+def decrypt_secret(oracle, block_size: int, prefix_length: int, known_plaintext: bytes = b'',
+                   journal=None, progress: ProgressReporter = None, **kwargs) -> bytes:
+    """
+    Decrypts the target bytes with iter_secret, which takes the remaining
+    keyword arguments. Decryption resumes after known_plaintext, and every
+    recovered byte is saved to the journal if one is given.
+    """
+    known = bytearray(known_plaintext)
+    for next_char in iter_secret(oracle, block_size, prefix_length, known_plaintext, **kwargs):
+        known += next_char
+        if journal is not None:
+            journal.save_progress(bytes(known))
+        if progress is not None and (len(known) + prefix_length) % block_size == 0:
+            progress.update(len(known))
+
+    return bytes(known)
+
+
+class VariablePrefixOracle(InstrumentedMixin):
+    """
+    A harder version of Oracle that draws a new random prefix for every call,
+    with its length picked uniformly from prefix_lengths
+    """
+    def __init__(self, key: bytes = None, prefix_lengths: Sequence[int] = range(1, 16)):
+        self.prefix_lengths = list(prefix_lengths)
+        self.core = ECBOracleCore(key, suffix=SECRET_SUFFIX)
+
+    @instrumented
+    def encrypt(self, plaintext: bytes) -> bytes:
+        length = self.prefix_lengths[rand_int(0, len(self.prefix_lengths) - 1)]
+        return self.core.encrypt(rand_bytes(length) + plaintext)
+
+
+class VariablePrefixAttack:
+    """
+    Byte-at-a-time decryption when the prefix length changes on every call.
+
+    Every query starts with a locator: block_size copies of a separator byte
+    followed by a marker block pair (two identical blocks). Each copy is
+    2 * block_size + 1 bytes long, so each is shifted one byte further against
+    the block boundaries than the one before, and exactly one of them is block
+    aligned whatever the prefix length. Its two identical ciphertext blocks
+    give the exact prefix length of that response.
+
+    After the locator come all 256 dictionary blocks for the next byte and
+    then the filler that puts that byte at the end of a block. One response
+    therefore holds a whole step of the attack, but only if the prefix length
+    has the residue (mod block_size) the padding in front of the dictionary
+    was chosen for. Responses with any other residue are discarded. The
+    residue aimed for is the most common one seen so far, so the expected
+    number of queries per byte is 1 / max_r P(prefix length = r mod block_size).
+
+    A step raises QueryBudgetExceeded after max_attempts queries without a
+    usable response, and so does any query past max_queries in total, so an
+    oracle that never produces the expected residue can't stall the attack.
+    """
+    SEPARATOR = b'\xff'
+    MARKER = b'\x00'
+    # Even with uniformly spread residues a step needs block_size queries on
+    # average, and failing 1000 in a row is then a ~1e-28 event
+    MAX_ATTEMPTS = 1000
+
+    def __init__(self, oracle, block_size: int = 16, max_queries: Optional[int] = None,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.oracle = oracle
+        self.block_size = block_size
+        self.max_queries = max_queries
+        self.max_attempts = max_attempts
+        self.locator = (self.SEPARATOR + self.MARKER * (2 * block_size)) * block_size
+        self.residues: Counter = Counter()
+        self.queries = 0
+        self.usable = 0
+
+    def locate(self, ciphertext: bytes) -> Optional[int]:
+        """
+        Returns the prefix length of a response to a query that starts with
+        the locator, or None if no marker pair is found
+        """
+        bs = self.block_size
+        blocks = [ciphertext[i:i + bs] for i in range(0, len(ciphertext), bs)]
+        for i in range(len(blocks) - 1):
+            if blocks[i] == blocks[i + 1]:
+                break
+        else:
+            return None
+
+        # The marker is a run of identical bytes, so the copies that aren't
+        # aligned still cover one whole marker block each. Counting them gives
+        # the index of the aligned copy.
+        marker = blocks[i]
+        copy = sum(1 for j in range(i) if blocks[j] == marker and (j == 0 or blocks[j - 1] != marker))
+        return i * bs - 1 - copy * (2 * bs + 1)
+
+    def target_residue(self) -> int:
+        if not self.residues:
+            return 0
+        return max(sorted(self.residues), key=self.residues.get)
+
+    def step(self, known: bytes) -> Optional[bytes]:
+        """
+        Queries until a usable response recovers the byte after known.
+        Returns None once the padding is reached.
+        """
+        bs = self.block_size
+        window = (b'A' * (bs - 1) + known)[-(bs - 1):]
+        dictionary_input = b''.join(window + bytes([c]) for c in range(256))
+        filler = b'A' * ((bs - 1 - len(known)) % bs)
+        target_offset = 256 + (len(filler) + len(known)) // bs
+
+        for _ in range(self.max_attempts):
+            if self.max_queries is not None and self.queries >= self.max_queries:
+                raise QueryBudgetExceeded(
+                    f"Recovered {len(known)} bytes with {self.queries} of {self.max_queries} queries")
+            residue = self.target_residue()
+            pad = b'B' * ((-(residue + len(self.locator))) % bs)
+            ciphertext = self.oracle.encrypt(self.locator + pad + dictionary_input + filler)
+            self.queries += 1
+
+            prefix_length = self.locate(ciphertext)
+            if prefix_length is None:
+                continue
+            self.residues[prefix_length % bs] += 1
+            if prefix_length % bs != residue:
+                continue
+            self.usable += 1
+
+            start = (prefix_length + len(self.locator) + len(pad)) // bs
+            blocks = [ciphertext[(start + i) * bs:(start + i + 1) * bs] for i in range(target_offset + 1)]
+            dictionary = {block: bytes([c]) for c, block in enumerate(blocks[:256])}
+            next_char = dictionary[blocks[target_offset]]
+            # The prefix changes the ciphertext length on every call, so the
+            # end is found from the lone \x01 padding byte instead of a
+            # length probe
+            return None if next_char == b'\x01' else next_char
+
+        raise QueryBudgetExceeded(
+            f"No usable response for byte {len(known)} in {self.max_attempts} queries")
+
+    def decrypt(self, known_plaintext: bytes = b'', progress: ProgressReporter = None) -> bytes:
+        while True:
+            next_char = self.step(known_plaintext)
+            if next_char is None:
+                return known_plaintext
+            known_plaintext += next_char
+            if progress is not None and len(known_plaintext) % self.block_size == 0:
+                progress.update(len(known_plaintext))
+
+    @property
+    def queries_per_byte(self) -> float:
+        return self.queries / self.usable if self.usable else 0.0
 
+
+def expected_queries_per_byte(prefix_lengths: Sequence[int], block_size: int = 16) -> float:
+    """
+    Expected queries per recovered byte of VariablePrefixAttack once it has
+    settled on the most common residue, for prefix lengths drawn uniformly
+    from prefix_lengths
+    """
+    residues = Counter(length % block_size for length in prefix_lengths)
+    return len(prefix_lengths) / max(residues.values())
+
+
+if __name__ == '__main__':
+    # Usage: chal14.py [journal.db]
+    # With a journal, the oracle uses a fixed key and prefix as a stand-in for
+    # a remote target that doesn't change between runs, and a restarted attack
+    # resumes from the last recovered byte.
+    journal = None
+    if len(sys.argv) > 1:
+        # The target name changes whenever the oracle's output does, as it did
+        # with the switch to real PKCS#7 padding, so stale journals are ignored
+        journal = Journal(sys.argv[1], target='chal14-pkcs7')
+        oracle = JournaledOracle(Oracle(key=b'YELLOW SUBMARINE', random_prefix=b'\x8a\x13\x07'), journal)
+    else:
+        oracle = Oracle()
+
+    metrics = oracle.metrics
+
+    # We know the block size is 16. So the value our detector gives us uncovers
+    # the length of the random prefix as 16 - block size
+    with metrics.phase('block-size detection'):
+        prefix_length, block_size = oracle.detect_block_size()
+    print(f'[+] Prefix length: {prefix_length}')
+    print(f'[+] Block size: {block_size}')
+    with metrics.phase('ecb detection'):
+        assert detect_aes_ecb(oracle.encrypt(b'A' * (block_size * 3)))
+    with metrics.phase('length probe'):
+        secret_length = oracle.detect_secret_length(prefix_length)
+    print(f'[+] Target length: {secret_length}')
+    progress = ProgressReporter(print_progress, total=secret_length, metrics=metrics)
+
+    known_plaintext = journal.load_progress() if journal else b''
+    if known_plaintext:
+        print(f'[+] Resuming after {len(known_plaintext)} recovered bytes')
+
+    known_plaintext = decrypt_secret(oracle, block_size, prefix_length, known_plaintext, journal, progress,
+                                     secret_length=secret_length)
     print('[+] Target bytes:')
     print(known_plaintext.decode())
+    print('[+] Oracle metrics:')
+    print(metrics.to_json(indent=2))
+    if journal:
+        print(f'[+] Journal hits: {journal.hits}, misses: {journal.misses}')
+        journal.close()
+
+    # The same attack against a prefix that changes length on every call
+    print('[+] Variable prefix, queries per recovered byte:')
+    print(f"    {'prefix lengths':<16} {'expected':>8} {'measured':>8} {'discarded':>9}")
+    for label, lengths in (('5', [5]), ('0-3', range(0, 4)), ('0-7', range(0, 8)), ('1-15', range(1, 16)),
+                           ('0-40', range(0, 41)), ('0-200', range(0, 201))):
+        attack = VariablePrefixAttack(VariablePrefixOracle(prefix_lengths=lengths))
+        assert attack.decrypt() == SECRET_SUFFIX
+        print(f'    {label:<16} {expected_queries_per_byte(lengths):>8.2f} {attack.queries_per_byte:>8.2f} '
+              f'{1 - attack.usable / attack.queries:>9.0%}')
@@ -24,24 +24,13 @@ Crypto nerds know where we're going with this. Bear with us.
   Source: https://www.ibm.com/docs/en/zos/2.4.0?topic=rules-pkcs-padding-method
 """
 
-import string
-
-
-def pkcs7_strip(data: bytes) -> bytes:
-    """
-    Strips PKCS#7 padding from the data
-    """
-    expected_padding_length = data[-1]
-    expected_padding = expected_padding_length.to_bytes(1, byteorder='big') * expected_padding_length
-    actual_padding = data[-expected_padding_length:]
-    if expected_padding != actual_padding:
-        raise ValueError("Invalid PKCS#7 padding")
-    return data[:-expected_padding_length]
+# The implementation lives in padding.py so that every oracle shares it
+from padding import PaddingError, pkcs7_pad, pkcs7_strip  # noqa: F401
 
 
 if __name__ == '__main__':
     assert pkcs7_strip(b"ICE ICE BABY\x04\x04\x04\x04") == b"ICE ICE BABY"
-    assert pkcs7_strip(b"ICE ICE BABY\x03\x03\x03") == b"ICE ICE BABY"
+    assert pkcs7_strip(b"ICE ICE BABY\x03\x03\x03", 15) == b"ICE ICE BABY"
     try:
         pkcs7_strip(b"ICE ICE BABY\x05\x05\x05\x05")
     except ValueError:
@@ -45,29 +45,18 @@ Before you implement this attack, answer this question: why does CBC mode have t
     blocks. This is not the case. Only the next block is affected.
 """
 
-from chal10 import AES_CBC
-from chal11 import rand_bytes
-from chal15 import pkcs7_strip
+from typing import TYPE_CHECKING, Iterable
 
-def pkcs7_pad(data: bytes, block_size: int) -> bytes:
-    """
-    Applies PKCS#7 padding to the data to make it an even multiple of the block size
-    """
-    padding_required = block_size - len(data) % block_size
-    assert padding_required < 16
-    return data + bytes([padding_required]) * padding_required
+if TYPE_CHECKING:
+    import numpy as np
 
+from chal10 import AES_CBC, xor_16
+from instrumentation import InstrumentedMixin, instrumented
+from oracle_core import rand_bytes
+from padding import pkcs7_pad, pkcs7_strip, pkcs7_validate_batch
 
-def pkcs7_strip(data: bytes) -> bytes:
-    """
-    Strips PKCS#7 padding from the data
-    """
-    expected_padding_length = data[-1]
-    expected_padding = expected_padding_length.to_bytes(1, byteorder='big') * expected_padding_length
-    actual_padding = data[-expected_padding_length:]
-    if expected_padding != actual_padding:
-        raise ValueError("Invalid PKCS#7 padding")
-    return data[:-expected_padding_length]
+
+ADMIN_MARKER = b';admin=true;'
 
 
 def add_comments_and_quote(data: str) -> str:
@@ -80,7 +69,7 @@ def add_comments_and_quote(data: str) -> str:
         ';comment2=%20like%20a%20pound%20of%20bacon'
     ])
 
-class Cipher:
+class Cipher(InstrumentedMixin):
     def __init__(self):
         random_key = rand_bytes(16)
         random_iv = rand_bytes(16)
@@ -90,20 +79,97 @@ class Cipher:
         prepared_data = add_comments_and_quote(data)
         return self.encrypt(prepared_data)
 
+    @instrumented
     def encrypt(self, data: str) -> bytes:
         return self.cipher.encrypt(pkcs7_pad(data.encode(), 16))
 
+    @instrumented
     def decrypt(self, data: bytes) -> bytes:
         return pkcs7_strip(self.cipher.decrypt(data))
 
     def is_admin(self, data: bytes) -> bool:
-        return b';admin=true;' in self.decrypt(data)
+        return ADMIN_MARKER in self.decrypt(data)
+
+    def is_admin_batch(self, ciphertexts: Iterable[bytes]) -> 'np.ndarray':
+        """
+        Checks many cookies at once. Ciphertexts of the same length are
+        decrypted together with a single ECB call over all of their blocks,
+        and the CBC XOR and padding checks are done with NumPy. Cookies with
+        invalid padding or length are not admin.
+        """
+        import numpy as np
+
+        ciphertexts = list(ciphertexts)
+        results = np.zeros(len(ciphertexts), dtype=bool)
+
+        groups = {}
+        for i, ciphertext in enumerate(ciphertexts):
+            if ciphertext and len(ciphertext) % 16 == 0:
+                groups.setdefault(len(ciphertext), []).append(i)
+
+        iv = np.frombuffer(self.cipher.iv, dtype=np.uint8)
+        for length, indices in groups.items():
+            joined = b''.join(ciphertexts[i] for i in indices)
+            blocks = np.frombuffer(joined, dtype=np.uint8).reshape(len(indices), -1, 16)
+            decrypted = np.frombuffer(self.cipher.cipher.decrypt(joined), dtype=np.uint8)
+            decrypted = decrypted.reshape(blocks.shape)
+
+            # CBC: each block is XORed with the previous ciphertext block
+            previous = np.empty_like(blocks)
+            previous[:, 0] = iv
+            previous[:, 1:] = blocks[:, :-1]
+            plaintext = (decrypted ^ previous).reshape(len(indices), length)
+
+            padding = pkcs7_validate_batch(plaintext[:, -16:])
+
+            rows = plaintext.tobytes()
+            for row, i in enumerate(indices):
+                if padding[row]:
+                    start = row * length
+                    end = start + length - padding[row]
+                    results[i] = rows.find(ADMIN_MARKER, start, end) != -1
+
+        return results
+
+    def is_admin_streaming(self, data: bytes) -> bool:
+        """
+        Decrypts block by block and stops as soon as the marker is found. The
+        last block is decrypted first to validate the padding and find where
+        the payload ends. The last len(marker) - 1 bytes of each block are
+        kept so that a marker spanning a block boundary is still found.
+        """
+        if not data or len(data) % 16:
+            raise ValueError("Invalid ciphertext length")
+
+        ecb = self.cipher.cipher
+        iv = self.cipher.iv
+        previous_last = data[-32:-16] if len(data) > 16 else iv
+        last_block = xor_16(ecb.decrypt(data[-16:]), previous_last)
+        payload_length = len(data) - 16 + len(pkcs7_strip(last_block))
+
+        overlap = len(ADMIN_MARKER) - 1
+        window = b''
+        previous = iv
+        for offset in range(0, len(data), 16):
+            block = data[offset:offset + 16]
+            plaintext = xor_16(ecb.decrypt(block), previous)
+            previous = block
+
+            # Only search the part of the block before the padding
+            window = window[-overlap:] + plaintext[:max(0, payload_length - offset)]
+            if ADMIN_MARKER in window:
+                return True
+            if offset + 16 >= payload_length:
+                break
+
+        return False
 
 
 if __name__ == '__main__':
-    assert pkcs7_strip(pkcs7_pad(b"hello", 12)) == b"hello"
-    assert pkcs7_strip(pkcs7_pad(b"hello", 16)) == b"hello"
-    assert pkcs7_strip(pkcs7_pad(b"hello", 20)) == b"hello"
+    assert pkcs7_strip(pkcs7_pad(b"hello", 12), 12) == b"hello"
+    assert pkcs7_strip(pkcs7_pad(b"hello", 16), 16) == b"hello"
+    assert pkcs7_strip(pkcs7_pad(b"hello", 20), 20) == b"hello"
+    assert pkcs7_strip(pkcs7_pad(b"YELLOW SUBMARINE", 16), 16) == b"YELLOW SUBMARINE"
     print('[+] PKCS#7 padding validation passed')
 
     cipher = Cipher()
@@ -112,21 +178,28 @@ if __name__ == '__main__':
     assert cipher.is_admin(cipher.create(';admin=true;')) == False
     print('[+] Input quoting and encryption passed')
 
-    # XOR encode the admin string using 0x41 as the key
-    admin_str = b';admin=true;'
-    xor_encoded_admin = bytes([
-        admin_str[i] ^ 0x41
-        for i in range(len(admin_str))
-    ])
-
-    ciphertext = cipher.create(xor_encoded_admin.decode())
-    
-    # XOR the block previous to userdata to get the desired plaintext
-    ct_array = bytearray(ciphertext)
-    for i in range(len(admin_str)):
-        ct_array[i + 16] ^= 0x41
-    modified_ct = bytes(ct_array)
+    # Flip ';admin=true;' into a block of filler, scrambling the block before
+    # it. The planner works out the layout from add_comments_and_quote.
+    from cbc_bitflip import BitflipPlanner
+    planner = BitflipPlanner.from_encoder(add_comments_and_quote)
+    plan = planner.plan_targets([ADMIN_MARKER])
+    modified_ct = plan.apply(cipher.create(plan.userdata))
 
     print(f'[+] Decrypted crafted ciphertext:')
     print(cipher.decrypt(modified_ct))
     print(f'[+] Is admin: {cipher.is_admin(modified_ct)}')
+    assert cipher.is_admin_streaming(modified_ct)
+    assert list(cipher.is_admin_batch([cipher.create('foo'), modified_ct])) == [False, True]
+
+    # Compare cookie verification throughput
+    import time
+    cookies = [cipher.create(f'user{i:05}') for i in range(20000)]
+    for name, verify in [
+        ('is_admin', lambda: [cipher.is_admin(cookie) for cookie in cookies]),
+        ('is_admin_streaming', lambda: [cipher.is_admin_streaming(cookie) for cookie in cookies]),
+        ('is_admin_batch', lambda: cipher.is_admin_batch(cookies)),
+    ]:
+        start = time.perf_counter()
+        verify()
+        elapsed = time.perf_counter() - start
+        print(f'[+] {name}: {len(cookies) / elapsed:,.0f} cookies/s')
@@ -11,6 +11,22 @@ Find it.
 from string import printable
 from collections import Counter
 from dataclasses import dataclass
+from typing import List, Sequence
+
+from profile_hooks import stage
+
+
+PRINTABLE_BYTES = frozenset(printable.encode())
+FREQUENT_LETTERS = b'etaoinshrdluETAOINSHRDLU'
+# bytes.translate tables that XOR every byte with a key, built on first use
+_xor_tables = {}
+
+
+def xor_table(key: int) -> bytes:
+    table = _xor_tables.get(key)
+    if table is None:
+        table = _xor_tables[key] = bytes(value ^ key for value in range(256))
+    return table
 
 
 @dataclass
@@ -20,6 +36,7 @@ class ScoredResult:
     score: int
 
 
+@stage('chal4 scoring')
 def find_xor_key(enc_data: bytes) -> ScoredResult:
     """
     This code was modified to from challenge 3 to use a dataclass to store the
@@ -53,6 +70,62 @@ def find_xor_key(enc_data: bytes) -> ScoredResult:
     return results[high_score_key]
 
 
+def byte_histogram(data: bytes) -> Sequence[int]:
+    counts = Counter(data)
+    return [counts.get(value, 0) for value in range(256)]
+
+
+def score_xor_keys(histogram: Sequence[int]) -> List[int]:
+    """
+    Same scoring as find_xor_key, but computed from a histogram of the
+    ciphertext bytes. XORing with a key only permutes the histogram, so every
+    score can be read off it without decrypting the data 256 times. Returns
+    the score of every key.
+    """
+    present = [value for value in range(256) if histogram[value]]
+
+    scores = []
+    for key in range(256):
+        score = 0
+
+        # Score lots of points for having all printable characters
+        if all(value ^ key in PRINTABLE_BYTES for value in present):
+            score += 50
+
+        # Score extra points for each space character
+        score += histogram[key ^ 0x20]
+
+        # Score points based on frequency of letters in English language
+        score += sum(histogram[key ^ letter] for letter in FREQUENT_LETTERS)
+
+        scores.append(score)
+
+    return scores
+
+
+@stage('chal4 scoring')
+def find_xor_key_from_histogram(histogram: Sequence[int], enc_data: bytes = b'') -> ScoredResult:
+    """
+    Returns the best scoring key of score_xor_keys. The plaintext is only
+    produced for the winning key, and only if enc_data is given.
+    """
+    scores = score_xor_keys(histogram)
+    best_key = scores.index(max(scores))
+    return ScoredResult(best_key, enc_data.translate(xor_table(best_key)), scores[best_key])
+
+
+@stage('chal4 scoring')
+def rank_xor_keys_from_histogram(histogram: Sequence[int], count: int) -> List[ScoredResult]:
+    """
+    Returns the count best scoring keys, best first, without plaintexts. Keys
+    with equal scores are in key order, so the first is the key
+    find_xor_key_from_histogram picks.
+    """
+    scores = score_xor_keys(histogram)
+    ranked = sorted(range(256), key=lambda key: -scores[key])[:count]
+    return [ScoredResult(key, b'', scores[key]) for key in ranked]
+
+
 if __name__ == '__main__':
     """
     Find the line in the file which has the highest score, which will be the
@@ -61,13 +134,13 @@ if __name__ == '__main__':
     Result:
     53: b'Now that the party is jumping\n'
     """
+    import datasets
+
     all_results = []
-    with open('files/4.txt') as f:
-        for line in f:
-            enc = bytes.fromhex(line.strip())
-            result = find_xor_key(enc)
-            if result.score > 0:
-                all_results.append(result)
+    for enc in datasets.lines('4.txt'):
+        result = find_xor_key(enc)
+        if result.score > 0:
+            all_results.append(result)
     
     best_result = max(all_results, key=lambda x: x.score)
     print(f"{best_result.key}: {best_result.plaintext}")
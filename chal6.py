@@ -46,10 +46,31 @@ few, to get accurate hamming distance scores for the keysize
 """
 
 
-from base64 import b64decode
-from typing import List
-
-from chal4 import find_xor_key
+import math
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from chal4 import byte_histogram, find_xor_key, find_xor_key_from_histogram, rank_xor_keys_from_histogram
+from profile_hooks import section, stage
+
+
+# Key bytes kept per column, partial keys kept by the beam search and the
+# number of plaintext bytes the beam search scores
+TOP_K = 3
+BEAM_WIDTH = 8
+SAMPLE_SIZE = 512
+# Keysizes scored by default. Multiples of the key length have about the same
+# normalized hamming distance as the length itself, so the best few are
+# usually the key length and some of its multiples.
+KEYSIZE_CANDIDATES = 3
+# A common divisor of the candidates is taken as the key length when the mean
+# index of coincidence of its columns is at least this fraction of the best
+# keysize's. Columns of the key length or a multiple of it are each XORed with
+# one key byte and keep the coincidence of English, while the columns of any
+# other length mix several key bytes and come out far lower.
+PERIOD_COINCIDENCE = 0.8
+# Reference text the bigram model is trained on
+ENGLISH_TEXT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files', 'english.txt')
 
 
 def hamming_distance(s1: bytes, s2: bytes) -> int:
@@ -64,6 +85,7 @@ def hamming_distance(s1: bytes, s2: bytes) -> int:
     return distance
 
 
+@stage('chal6 keysize scoring')
 def get_keysizes(data: bytes, size_count: int = 1) -> List[int]:
     """
     Determines the key size statistically by hamming distance and returns the
@@ -126,19 +148,217 @@ def transpose_chunks(chunks: List[bytes], size: int) -> List[bytes]:
     return blocks
 
 
-def break_repeating_xor_key(data: bytes) -> bytes:
-    keys = []
-    for keysize in get_keysizes(data):
-        chunks = get_chunks(data, keysize)
-        blocks = transpose_chunks(chunks, keysize)
+class ColumnHistograms:
+    """
+    Byte histograms of the transposed blocks, cached by (keysize, column).
+
+    Column c at keysize k holds the bytes at c, c + k, c + 2k, ... which are
+    exactly the columns c, c + k, ... of any multiple of k. Histograms are only
+    built from the data for the largest keysize in each family, and the
+    divisors are derived by summing its columns. Only complete chunks are
+    used, like get_chunks, so the few bytes a divisor has beyond the
+    multiple's last complete chunk are added on top.
+    """
+    def __init__(self, data: bytes):
+        self.data = data
+        self.histograms: Dict[Tuple[int, int], Sequence[int]] = {}
+        self.built = 0
+
+    def build(self, keysize: int):
+        end = len(self.data) // keysize * keysize
+        for column in range(keysize):
+            self.histograms[keysize, column] = byte_histogram(self.data[column:end:keysize])
+        self.built += 1
+
+    def derive(self, keysize: int, multiple: int):
+        data = self.data
+        end = len(data) // keysize * keysize
+        multiple_end = len(data) // multiple * multiple
+        for column in range(keysize):
+            histogram = [sum(counts) for counts in zip(*(
+                self.histograms[multiple, c] for c in range(column, multiple, keysize)
+            ))]
+            for value in data[multiple_end + column:end:keysize]:
+                histogram[value] += 1
+            self.histograms[keysize, column] = histogram
+
+    @stage('chal6 column histograms')
+    def prepare(self, keysizes: Iterable[int]):
+        """
+        Makes sure every column of every keysize is cached, building from the
+        data only for keysizes that have no multiple among the others
+        """
+        keysizes = sorted(set(keysizes), reverse=True)
+        roots = []
+        for keysize in keysizes:
+            if (keysize, 0) in self.histograms:
+                continue
+            multiple = next((m for m in roots if m % keysize == 0), None)
+            if multiple is None:
+                self.build(keysize)
+                roots.append(keysize)
+            else:
+                self.derive(keysize, multiple)
+
+    def column(self, keysize: int, column: int) -> Sequence[int]:
+        if (keysize, column) not in self.histograms:
+            self.prepare([keysize])
+        return self.histograms[keysize, column]
+
+
+class BigramModel:
+    """
+    Log probabilities of byte pairs in English text, with add-one smoothing so
+    that unseen pairs are unlikely rather than impossible. The default model
+    is trained on files/english.txt, a few pages of public domain prose.
+    """
+    def __init__(self, text: bytes):
+        counts = [1] * 65536
+        for a, b in zip(text, text[1:]):
+            counts[a << 8 | b] += 1
+        self.log_probs = []
+        for a in range(256):
+            row = counts[a << 8:(a + 1) << 8]
+            total = sum(row)
+            self.log_probs.extend(math.log(count / total) for count in row)
+
+    def score(self, plaintext: bytes) -> float:
+        log_probs = self.log_probs
+        return sum(log_probs[a << 8 | b] for a, b in zip(plaintext, plaintext[1:]))
+
+
+_bigram_model = None
+
+
+def bigram_model() -> BigramModel:
+    global _bigram_model
+    if _bigram_model is None:
+        with open(ENGLISH_TEXT, 'rb') as f:
+            _bigram_model = BigramModel(f.read())
+    return _bigram_model
+
+
+@stage('chal6 beam search')
+def beam_search_key(data: bytes, candidates: List[List[int]], beam_width: int = BEAM_WIDTH,
+                    sample_size: int = SAMPLE_SIZE) -> bytes:
+    """
+    Picks one key byte per column out of each column's candidates, best first,
+    by the bigram likelihood of the plaintext they give for the first
+    sample_size bytes of data.
+
+    The key is built a column at a time. Adding column c only adds the pairs
+    from column c - 1 to c, so each partial key is scored incrementally and
+    only the beam_width best partial keys are extended. The cost is at most
+    beam_width * top_k * sample_size / keysize pair lookups per column, i.e.
+    bounded by beam_width * top_k * sample_size for the whole key.
+    """
+    keysize = len(candidates)
+    sample = data[:sample_size]
+    log_probs = bigram_model().log_probs
+
+    def pair_score(column: int, previous_key: int, key: int) -> float:
+        # The pairs that start in column - 1 and end in column
+        start = (column - 1) % keysize
+        return sum(log_probs[(a ^ previous_key) << 8 | (b ^ key)]
+                   for a, b in zip(sample[start::keysize], sample[start + 1::keysize]))
+
+    # Column 0 has no pairs yet, so the beam starts in the order of the
+    # column scores
+    beam: List[Tuple[float, bytes]] = [(0.0, bytes([key])) for key in candidates[0][:beam_width]]
+    for column in range(1, keysize):
+        extended = [(score + pair_score(column, prefix[-1], key), prefix + bytes([key]))
+                    for score, prefix in beam for key in candidates[column]]
+        beam = sorted(extended, key=lambda item: -item[0])[:beam_width]
+
+    # Close the loop with the pairs from the last column into the next chunk
+    return max(beam, key=lambda item: item[0] + pair_score(0, item[1][-1], item[1][0]))[1]
 
-        # Solve each block as if it were a single byte xor
-        keyscores = [find_xor_key(block) for block in blocks]
-        if any(score.score == 0 for score in keyscores):
-            continue
 
-        xor_key = bytes([score.key for score in keyscores])
-        keys.append(xor_key)
+def shortest_period(key: bytes) -> bytes:
+    """
+    Returns the shortest key that repeats to key, e.g. b'ICE' for b'ICEICE'
+    """
+    for size in range(1, len(key)):
+        if len(key) % size == 0 and key == key[:size] * (len(key) // size):
+            return key[:size]
+    return key
+
+
+def coincidence(histograms: ColumnHistograms, keysize: int) -> float:
+    """
+    Mean index of coincidence of the columns at keysize, i.e. the chance that
+    two bytes drawn from the same column are equal
+    """
+    total = 0.0
+    for column in range(keysize):
+        histogram = histograms.column(keysize, column)
+        count = sum(histogram)
+        if count > 1:
+            total += sum(n * (n - 1) for n in histogram) / (count * (count - 1))
+    return total / keysize
+
+
+def key_period(keysize: int, keysizes: Sequence[int], histograms: ColumnHistograms) -> int:
+    """
+    Returns the shortest common divisor of keysize and the other candidate
+    keysizes that still looks like the key length, or keysize itself. Only
+    candidates that are multiples of a common length are considered, and they
+    are screened by coincidence, see PERIOD_COINCIDENCE, without solving them.
+    """
+    divisors = sorted({math.gcd(keysize, other) for other in keysizes} - {1, keysize})
+    if not divisors:
+        return keysize
+    histograms.prepare([keysize, *divisors])
+    threshold = PERIOD_COINCIDENCE * coincidence(histograms, keysize)
+    return next((d for d in divisors if coincidence(histograms, d) >= threshold), keysize)
+
+
+def solve_keysize(data: bytes, keysize: int, histograms: ColumnHistograms, top_k: int = TOP_K,
+                  beam_width: int = BEAM_WIDTH) -> Optional[bytes]:
+    """
+    Solves the key for one keysize. Each column contributes its top_k single
+    byte XOR keys and the beam search combines them. With top_k=1 this is the
+    plain per-column solve, which gives up on the keysize (returns None) if
+    any column scores 0.
+    """
+    with section('chal6 column solving'):
+        ranked = [rank_xor_keys_from_histogram(histograms.column(keysize, column), top_k)
+                  for column in range(keysize)]
+    if top_k == 1:
+        if any(column[0].score == 0 for column in ranked):
+            return None
+        return bytes(column[0].key for column in ranked)
+    return beam_search_key(data, [[result.key for result in column] for column in ranked], beam_width)
+
+
+def break_repeating_xor_key(data: bytes, size_count: int = 1, top_k: int = TOP_K,
+                            beam_width: int = BEAM_WIDTH) -> List[bytes]:
+    """
+    Returns a key for each of the size_count most likely keysizes.
+
+    Multiples of the key length score about as well as the length itself, so
+    at least KEYSIZE_CANDIDATES keysizes are taken from get_keysizes and each
+    of the size_count best is replaced by the key length it is a multiple of,
+    see key_period. The single byte XOR keys are solved from cached column
+    histograms, see ColumnHistograms, combined by beam search, see
+    beam_search_key, and reduced to their shortest period.
+    """
+    keysizes = get_keysizes(data, max(size_count, KEYSIZE_CANDIDATES))
+    histograms = ColumnHistograms(data)
+    periods = []
+    for keysize in keysizes[:size_count]:
+        period = key_period(keysize, keysizes, histograms)
+        if period not in periods:
+            periods.append(period)
+    histograms.prepare(periods)
+
+    keys = []
+    for keysize in periods:
+        key = solve_keysize(data, keysize, histograms, top_k, beam_width)
+        if key is not None:
+            key = shortest_period(key)
+            if key not in keys:
+                keys.append(key)
 
     return keys
 
@@ -147,10 +367,49 @@ if __name__ == '__main__':
     # Test the hamming distance function
     assert hamming_distance(b"this is a test", b"wokka wokka!!!") == 37
     
-    with open("files/6.txt", "rb") as f:
-        data = b64decode(f.read())
+    import datasets
+    data = datasets.blob('6.txt')
 
     for key in break_repeating_xor_key(data):
         plaintext = bytes([data[i] ^ key[i % len(key)] for i in range(len(data))])
         print(f"*** key: {key} ***\n")
         print(plaintext.decode())
+
+    # The derived histograms match the ones built from the transposed blocks
+    histograms = ColumnHistograms(data)
+    histograms.prepare(range(2, 41))
+    for keysize in range(2, 41):
+        blocks = transpose_chunks(get_chunks(data, keysize), keysize)
+        assert all(histograms.column(keysize, i) == byte_histogram(block) for i, block in enumerate(blocks))
+    print(f"[+] Histograms for keysizes 2-40 built from the data for {histograms.built} keysizes")
+
+    # Compare against transposing and solving every keysize from scratch
+    import timeit
+
+    def legacy_solve(keysizes):
+        return [bytes(find_xor_key(block).key for block in transpose_chunks(get_chunks(data, k), k))
+                for k in keysizes]
+
+    def cached_solve(keysizes):
+        histograms = ColumnHistograms(data)
+        histograms.prepare(keysizes)
+        return [bytes(find_xor_key_from_histogram(histograms.column(k, c)).key for c in range(k))
+                for k in keysizes]
+
+    keysizes = [29, 58, 87]
+    assert legacy_solve(keysizes) == cached_solve(keysizes)
+    for name, solve in (('transpose and solve', legacy_solve), ('cached histograms', cached_solve)):
+        runs, elapsed = timeit.Timer(lambda: solve(keysizes)).autorange()
+        print(f"[+] {name}: {elapsed / runs * 1000:.1f} ms for keysizes {keysizes}")
+
+    # Short ciphertexts leave few bytes per column, so the best single byte
+    # key of a column is often wrong. The beam search recovers more of the key
+    # from the top 3 bytes of each column than the per-column solve.
+    key = break_repeating_xor_key(data)[0]
+    print(f"[+] Correct key bytes at keysize {len(key)} from the first n bytes (per-column solve / beam search):")
+    for n in (90, 120, 180, 240, 360):
+        histograms = ColumnHistograms(data[:n])
+        greedy = solve_keysize(data[:n], len(key), histograms, top_k=1) or bytes(len(key))
+        beam = solve_keysize(data[:n], len(key), histograms)
+        print(f"    n={n:<4} {sum(a == b for a, b in zip(greedy, key)):>2} / "
+              f"{sum(a == b for a, b in zip(beam, key)):>2} of {len(key)}")
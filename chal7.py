@@ -12,17 +12,15 @@ Easiest way: use OpenSSL::Cipher and give it AES-128-ECB as the cipher.
 """
 
 
-from base64 import b64decode
-from Crypto.Cipher import AES
-
-
 def aes_ecb_decrypt(data: bytes, key: bytes) -> bytes:
+    # Imported here so that importing this module doesn't load pycryptodome
+    from Crypto.Cipher import AES
     cipher = AES.new(key, AES.MODE_ECB)
     return cipher.decrypt(data)
 
 
 if __name__ == '__main__':
-    with open("files/7.txt", "r") as f:
-        data = b64decode(f.read())
+    import datasets
+    data = datasets.blob('7.txt')
 
     print(aes_ecb_decrypt(data, b"YELLOW SUBMARINE").decode())
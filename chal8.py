@@ -30,10 +30,10 @@ def detect_aes_ecb(ciphertext: bytes) -> bool:
 
 
 if __name__ == '__main__':
-    with open("files/8.txt", "r") as f:
-        ciphertexts = [bytes.fromhex(line.strip()) for line in f.readlines()]
-
-    for i, ciphertext in enumerate(ciphertexts):
+    # The lines are decoded once into a cached sidecar by datasets. ecb_detect
+    # streams captures that are too large to decode up front.
+    import datasets
+    for i, ciphertext in enumerate(datasets.lines('8.txt')):
         if detect_aes_ecb(ciphertext):
             print(f"AES ECB ciphertext likely at index {i}:")
             print(ciphertext.hex())
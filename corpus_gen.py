@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Synthetic ciphertext corpora for scale testing
+
+The inputs in files/ are a few kilobytes each. This module generates inputs of
+the same shape at any size, encrypted with the repo's own schemes, so that
+chal4, chal6 and chal8 can be run against gigabytes:
+
+- single-xor: hex lines of random bytes, a fraction of which are English text
+  XORed with a single byte key (like 4.txt)
+- repeating-xor: base64 of English text XORed with a repeating key of a
+  length picked from a range, wrapped at 60 characters (like 6.txt)
+- ecb-cbc: hex lines of AES ciphertexts of English text, a fraction of which
+  are ECB and the rest CBC (like 8.txt). Every plaintext repeats one block a
+  few times, so ECB lines can be detected and CBC lines hide the repeat.
+
+The plaintext is drawn from a weighted vocabulary of common English words, so
+it has roughly the letter and space frequencies the scoring expects. All output
+is deterministic for a seed and is written as it is generated, so memory use
+doesn't grow with the size of the corpus.
+
+The ground truth is written next to the corpus as JSON lines (OUTPUT.truth.jsonl):
+a header with the parameters, one record per hidden line, ECB line or key, and
+a summary. `check` runs the challenge code on a corpus and scores it against
+the ground truth.
+
+Usage:
+    corpus_gen.py KIND OUTPUT [--size SIZE] [--seed SEED] [options]
+    corpus_gen.py check OUTPUT
+"""
+
+import argparse
+import base64
+import heapq
+import json
+import os
+import random
+import sys
+import time
+from itertools import islice
+from typing import Dict, Iterator, Sequence, Tuple
+
+from chal2 import xor_by
+
+
+# Common English words and their relative frequencies per million words
+VOCABULARY = {
+    'the': 56271, 'of': 33950, 'and': 29944, 'to': 25956, 'a': 21626, 'in': 18214, 'is': 9910, 'that': 9246,
+    'for': 8439, 'it': 8345, 'was': 8297, 'on': 6445, 'with': 6352, 'he': 6304, 'as': 6162, 'you': 6083,
+    'I': 5932, 'be': 5827, 'at': 5132, 'by': 5099, 'this': 4962, 'had': 4637, 'not': 4560, 'are': 4484,
+    'but': 4381, 'from': 4266, 'or': 4080, 'have': 3913, 'an': 3725, 'they': 3614, 'which': 3503,
+    'one': 3356, 'were': 3253, 'her': 3121, 'all': 3050, 'she': 2950, 'there': 2711, 'would': 2660,
+    'their': 2597, 'we': 2563, 'him': 2511, 'been': 2480, 'has': 2425, 'when': 2413, 'who': 2352,
+    'will': 2282, 'more': 2236, 'no': 2230, 'if': 2222, 'out': 2140, 'so': 2094, 'said': 2041,
+    'what': 1997, 'up': 1921, 'its': 1893, 'about': 1815, 'into': 1780, 'than': 1731, 'them': 1707,
+    'can': 1699, 'only': 1672, 'other': 1642, 'new': 1592, 'some': 1560, 'could': 1554, 'time': 1517,
+    'these': 1487, 'two': 1429, 'may': 1409, 'then': 1394, 'do': 1380, 'first': 1348, 'any': 1314,
+    'my': 1306, 'now': 1283, 'such': 1252, 'like': 1228, 'our': 1210, 'over': 1188, 'man': 1160,
+    'me': 1141, 'even': 1119, 'most': 1102, 'made': 1082, 'after': 1071, 'also': 1050, 'did': 1038,
+    'many': 1015, 'before': 997, 'must': 982, 'through': 969, 'back': 952, 'years': 938, 'where': 921,
+    'much': 909, 'your': 894, 'way': 881, 'well': 866, 'down': 853, 'should': 840, 'because': 826,
+    'each': 811, 'just': 798, 'those': 786, 'people': 774, 'how': 761, 'too': 749, 'little': 738,
+    'state': 726, 'good': 715, 'very': 704, 'make': 693, 'world': 682, 'still': 671, 'own': 661,
+    'see': 651, 'men': 641, 'work': 631, 'long': 621, 'get': 612, 'here': 603, 'between': 594,
+    'both': 585, 'life': 576, 'being': 567, 'under': 559, 'never': 551, 'day': 543, 'same': 535,
+    'another': 527, 'know': 519, 'while': 511, 'last': 504, 'might': 497, 'us': 490, 'great': 483,
+    'old': 476, 'year': 469, 'off': 462, 'come': 456, 'since': 449, 'against': 443, 'go': 437,
+    'came': 431, 'right': 425, 'used': 419, 'take': 413, 'three': 407, 'party': 380, 'music': 360,
+    'night': 350, 'bell': 120, 'rhythm': 90, 'jumping': 60,
+}
+SENTENCE_ENDS = (b'.', b'.', b'.', b'!', b'?')
+LINE_WIDTH = 60
+# Bytes encoded by one whole line of base64
+LINE_BYTES = LINE_WIDTH * 3 // 4
+# chal6 only scores key sizes from 2 to 39
+KEY_LENGTHS = (2, 39)
+# check breaks repeating-xor corpora from their first 64 KiB, which is plenty
+# for a key of up to 39 bytes
+CHECK_SAMPLE_LINES = (1 << 16) // LINE_BYTES
+
+
+class EnglishText:
+    """
+    An endless, seeded stream of English-like sentences
+    """
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.words = [word.encode() for word in VOCABULARY]
+        self.cum_weights = []
+        total = 0
+        for weight in VOCABULARY.values():
+            total += weight
+            self.cum_weights.append(total)
+        self.buffer = bytearray()
+
+    def sentence(self) -> bytes:
+        rng = self.rng
+        words = rng.choices(self.words, cum_weights=self.cum_weights, k=rng.randint(4, 16))
+        if rng.random() < 0.3:
+            comma = rng.randrange(1, len(words))
+            words[comma - 1] += b','
+        words[0] = words[0][:1].upper() + words[0][1:]
+        return b' '.join(words) + rng.choice(SENTENCE_ENDS) + (b'\n' if rng.random() < 0.15 else b' ')
+
+    def read(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            self.buffer += self.sentence()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def repeating_xor(data: bytes, key: bytes, offset: int = 0) -> bytes:
+    """
+    XORs data with a repeating key, starting offset bytes into the key stream
+    """
+    start = offset % len(key)
+    keystream = (key[start:] + key * (len(data) // len(key) + 1))[:len(data)]
+    return xor_by(data, keystream)
+
+
+class TruthWriter:
+    """
+    Writes the ground truth of a corpus as JSON lines
+    """
+
+    def __init__(self, path: str, header: dict):
+        self.file = open(path, 'w')
+        self.write({'type': 'header', **header})
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self, summary: dict):
+        self.write({'type': 'summary', **summary})
+        self.file.close()
+
+
+def truth_path(output: str) -> str:
+    return output + '.truth.jsonl'
+
+
+def _last_line(path: str, block_size: int = 4096) -> bytes:
+    """
+    Reads the last line of a file backwards from its end
+    """
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b''
+        # Two newlines: the one ending the last line and the one before it
+        while position > 0 and tail.count(b'\n') < 2:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+    return tail.rstrip(b'\n').rsplit(b'\n', 1)[-1]
+
+
+def _iter_records(path: str) -> Iterator[dict]:
+    with open(path) as f:
+        next(f)
+        for line in f:
+            record = json.loads(line)
+            if record['type'] == 'summary':
+                return
+            yield record
+
+
+def read_truth(output: str) -> Tuple[dict, Iterator[dict], dict]:
+    """
+    Returns the header, the records and the summary of a corpus' ground truth.
+    The records are streamed from the file, since a large single-xor corpus
+    has hundreds of thousands of them, and the summary is read from the end.
+    """
+    path = truth_path(output)
+    with open(path) as f:
+        header = json.loads(f.readline())
+    return header, _iter_records(path), json.loads(_last_line(path))
+
+
+def generate_single_xor(output: str, size: int, seed: int = 0, hidden_fraction: float = 0.01,
+                        line_bytes: int = 30) -> dict:
+    """
+    Writes size bytes (before hex encoding) of random lines with a fraction of
+    single byte XOR encrypted English lines among them
+    """
+    rng = random.Random(seed)
+    text = EnglishText(rng)
+    lines = size // line_bytes
+    truth = TruthWriter(truth_path(output), {'kind': 'single-xor', 'seed': seed, 'size': size,
+                                             'hidden_fraction': hidden_fraction, 'line_bytes': line_bytes})
+    hidden = 0
+    with open(output, 'w') as f:
+        for index in range(lines):
+            if rng.random() < hidden_fraction:
+                key = rng.randrange(1, 256)
+                plaintext = text.read(line_bytes)
+                line = xor_by(plaintext, bytes([key]) * line_bytes)
+                truth.write({'type': 'hidden', 'line': index, 'key': key, 'plaintext': plaintext.decode()})
+                hidden += 1
+            else:
+                line = rng.randbytes(line_bytes)
+            f.write(line.hex() + '\n')
+    summary = {'lines': lines, 'hidden': hidden}
+    truth.close(summary)
+    return summary
+
+
+def generate_repeating_xor(output: str, size: int, seed: int = 0, key_lengths: Sequence[int] = KEY_LENGTHS,
+                           chunk_size: int = 1 << 16) -> dict:
+    """
+    Writes size bytes (before base64 encoding) of English text encrypted with
+    a random key whose length is picked from the key_lengths range
+    """
+    rng = random.Random(seed)
+    key = rng.randbytes(rng.randint(*key_lengths))
+    text = EnglishText(rng)
+    truth = TruthWriter(truth_path(output), {'kind': 'repeating-xor', 'seed': seed, 'size': size,
+                                             'key_lengths': list(key_lengths)})
+    truth.write({'type': 'key', 'key': key.hex(), 'length': len(key)})
+
+    # Chunks that are a multiple of LINE_BYTES encode to whole lines with no
+    # padding until the last one
+    chunk_size -= chunk_size % LINE_BYTES
+    written = 0
+    with open(output, 'w') as f:
+        while written < size:
+            plaintext = text.read(min(chunk_size, size - written))
+            encoded = base64.b64encode(repeating_xor(plaintext, key, written)).decode()
+            f.writelines(encoded[i:i + LINE_WIDTH] + '\n' for i in range(0, len(encoded), LINE_WIDTH))
+            written += len(plaintext)
+    summary = {'bytes': written}
+    truth.close(summary)
+    return summary
+
+
+def generate_ecb_cbc(output: str, size: int, seed: int = 0, ecb_fraction: float = 0.01,
+                     line_bytes: int = 160, repeats: int = 4) -> dict:
+    """
+    Writes size bytes (before hex encoding) of AES ciphertexts, one per line.
+    Each plaintext has one block repeated `repeats` times at block boundaries
+    and is encrypted with ECB for a fraction of the lines and CBC otherwise.
+    """
+    from chal10 import AES_CBC
+    from oracle_core import ECBOracleCore
+    from padding import pkcs7_pad
+
+    if line_bytes % 16 or repeats > line_bytes // 16:
+        raise ValueError("line_bytes must be a whole number of blocks with room for the repeats")
+
+    rng = random.Random(seed)
+    text = EnglishText(rng)
+    lines = size // line_bytes
+    blocks = line_bytes // 16
+    truth = TruthWriter(truth_path(output), {'kind': 'ecb-cbc', 'seed': seed, 'size': size,
+                                             'ecb_fraction': ecb_fraction, 'line_bytes': line_bytes,
+                                             'repeats': repeats})
+    ecb = 0
+    with open(output, 'w') as f:
+        for index in range(lines):
+            # One byte short of the line, so that PKCS#7 adds a single byte
+            plaintext = bytearray(text.read(line_bytes - 1))
+            repeated = text.read(16)
+            for block in rng.sample(range(blocks - 1), repeats):
+                plaintext[block * 16:block * 16 + 16] = repeated
+
+            key = rng.randbytes(16)
+            if rng.random() < ecb_fraction:
+                ciphertext = ECBOracleCore(key).encrypt(bytes(plaintext))
+                truth.write({'type': 'ecb', 'line': index, 'key': key.hex()})
+                ecb += 1
+            else:
+                ciphertext = AES_CBC(key, rng.randbytes(16)).encrypt(pkcs7_pad(bytes(plaintext), 16))
+            f.write(ciphertext.hex() + '\n')
+    summary = {'lines': lines, 'ecb': ecb}
+    truth.close(summary)
+    return summary
+
+
+GENERATORS = {
+    'single-xor': generate_single_xor,
+    'repeating-xor': generate_repeating_xor,
+    'ecb-cbc': generate_ecb_cbc,
+}
+
+
+def check_single_xor(output: str, header: dict, records: Iterator[dict], summary: dict) -> Dict[str, float]:
+    """
+    Ranks every line by its chal4 score. The top lines, as many as were
+    hidden, should be the hidden ones and decrypt under the right keys.
+    """
+    from chal4 import byte_histogram, find_xor_key_from_histogram
+    from ecb_detect import iter_hex_lines
+
+    hidden = {record['line']: record for record in records}
+    def scored():
+        for index, (_, line) in enumerate(iter_hex_lines(output)):
+            result = find_xor_key_from_histogram(byte_histogram(line), line)
+            yield result.score, index, result.key
+
+    # Only as many lines as were hidden are kept, not a score for every line
+    top = heapq.nlargest(len(hidden), scored())
+    found = [(index, key) for _, index, key in top if index in hidden]
+    return {
+        'hidden': len(hidden),
+        'precision_at_hidden': len(found) / len(hidden) if hidden else 1.0,
+        'key_accuracy': sum(hidden[index]['key'] == key for index, key in found) / len(found) if found else 0.0,
+    }
+
+
+def check_repeating_xor(output: str, header: dict, records: Iterator[dict], summary: dict) -> Dict[str, float]:
+    """
+    Breaks the start of the corpus with chal6 and compares the best candidate
+    key. A candidate of the wrong length loses a byte of accuracy for every
+    byte it is too long or too short.
+    """
+    from chal6 import break_repeating_xor_key
+
+    with open(output, 'rb') as f:
+        data = base64.b64decode(b''.join(islice(f, CHECK_SAMPLE_LINES)))
+    key = bytes.fromhex(next(records)['key'])
+    candidate = break_repeating_xor_key(data)[0]
+    return {
+        'key_length': len(key),
+        'key_found': float(candidate == key),
+        'byte_accuracy': sum(a == b for a, b in zip(candidate, key)) / max(len(candidate), len(key)),
+    }
+
+
+def check_ecb_cbc(output: str, header: dict, records: Iterator[dict], summary: dict) -> Dict[str, float]:
+    """
+    Runs chal8's detection on every line
+    """
+    from chal8 import detect_aes_ecb
+    from ecb_detect import iter_hex_lines
+
+    ecb = {record['line'] for record in records}
+    detected = {index for index, (_, line) in enumerate(iter_hex_lines(output)) if detect_aes_ecb(line)}
+    true_positives = len(ecb & detected)
+    return {
+        'ecb': len(ecb),
+        'precision': true_positives / len(detected) if detected else 1.0,
+        'recall': true_positives / len(ecb) if ecb else 1.0,
+    }
+
+
+CHECKS = {
+    'single-xor': check_single_xor,
+    'repeating-xor': check_repeating_xor,
+    'ecb-cbc': check_ecb_cbc,
+}
+
+
+def check(output: str) -> Dict[str, float]:
+    header, records, summary = read_truth(output)
+    return CHECKS[header['kind']](output, header, records, summary)
+
+
+def parse_size(text: str) -> int:
+    """
+    Parses sizes like 4096, 64K, 10M or 2G
+    """
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if text[-1:].upper() in units:
+        return int(float(text[:-1]) * units[text[-1].upper()])
+    return int(text)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('kind', choices=(*GENERATORS, 'check'))
+    parser.add_argument('output', help='corpus file to write, or to check')
+    parser.add_argument('--size', type=parse_size, default=parse_size('1M'),
+                        help='decoded size of the corpus, e.g. 64K, 10M or 2G (default: 1M)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fraction', type=float,
+                        help='fraction of hidden lines for single-xor or of ECB lines for ecb-cbc (default: 0.01)')
+    parser.add_argument('--key-lengths', default='-'.join(map(str, KEY_LENGTHS)),
+                        help='range of repeating key lengths (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.kind == 'check':
+        start = time.perf_counter()
+        results = check(args.output)
+        print(json.dumps(results, indent=2))
+        print(f'[+] Checked in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+        sys.exit(0)
+
+    options = {}
+    if args.kind == 'repeating-xor':
+        if args.fraction is not None:
+            parser.error('--fraction does not apply to repeating-xor')
+        low, _, high = args.key_lengths.partition('-')
+        options['key_lengths'] = (int(low), int(high or low))
+    elif args.fraction is not None:
+        options['hidden_fraction' if args.kind == 'single-xor' else 'ecb_fraction'] = args.fraction
+
+    start = time.perf_counter()
+    summary = GENERATORS[args.kind](args.output, args.size, args.seed, **options)
+    elapsed = time.perf_counter() - start
+    print(f'[+] Wrote {args.output} and {truth_path(args.output)}: {summary}')
+    print(f'[+] {args.size / elapsed / 1e6:.1f} MB/s')
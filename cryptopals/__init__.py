@@ -0,0 +1,74 @@
+"""
+Reusable primitives from the challenges, importable from one place
+
+    from cryptopals import xor_by, pkcs7_pad, AES_CBC
+
+The challenges stay flat scripts; this package only maps each name to the
+module that defines it. Nothing is imported until a name is first used (PEP
+562 module __getattr__), so importing the package is nearly free, and e.g.
+xor_by never loads NumPy or pycryptodome.
+"""
+
+import os
+import sys
+
+# The challenge modules live next to this package and import each other by
+# their flat names, so their directory has to be importable. It goes first on
+# the path: some of those names (datasets, padding, journal, ...) are also
+# names of installed distributions, and appending would silently load those
+# instead. The trade-off is that once cryptopals is imported, the repo's
+# modules shadow any installed package with the same name for the rest of the
+# process.
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if sys.path[:1] != [_ROOT]:
+    if _ROOT in sys.path:
+        sys.path.remove(_ROOT)
+    sys.path.insert(0, _ROOT)
+
+_EXPORTS = {
+    # XOR
+    'xor_by': 'chal2',
+    'ice_encode': 'chal5',
+    'xor_16': 'chal10',
+    # Encoding
+    'b64encode': 'chal1',
+    # Padding
+    'PaddingError': 'padding',
+    'pkcs7_pad': 'padding',
+    'pkcs7_strip': 'padding',
+    'pkcs7_strip_view': 'padding',
+    'pkcs7_validate_batch': 'padding',
+    # Block views
+    'get_chunks': 'chal6',
+    'block_words': 'ecb_detect',
+    'block_repeats': 'ecb_detect',
+    # Scoring
+    'ScoredResult': 'chal4',
+    'byte_histogram': 'chal4',
+    'find_xor_key': 'chal4',
+    'find_xor_key_from_histogram': 'chal4',
+    'hamming_distance': 'chal6',
+    'break_repeating_xor_key': 'chal6',
+    # AES modes
+    'AES_CBC': 'chal10',
+    'aes_ecb_decrypt': 'chal7',
+    'detect_aes_ecb': 'chal8',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name: str):
+    try:
+        module = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    # __import__ rather than importlib, so that -X importtime sees the import
+    value = getattr(__import__(module), name)
+    # Cache it so that __getattr__ isn't called for this name again
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Cached loader for the challenge inputs in files/
+
+The inputs are stored as text, base64 for the blobs (6, 7 and 10) and one hex
+ciphertext per line for the line-oriented files (4 and 8). Decoding them on
+every run is wasted work, so each input is decoded once into a binary sidecar
+in files/.cache/ and later runs memory-map the sidecar instead:
+
+- blob(name) returns a read-only memoryview over the decoded bytes
+- lines(name) returns a Lines object, whose rows are memoryviews into a
+  fixed-width 2-D array of the decoded lines, zero padded to the longest one.
+  The true length of each row is stored in front of the array, as
+  little-endian uint32s on every platform.
+
+Nothing is copied out of the mapping, and NumPy is only imported when a 2-D
+array view of the lines is asked for.
+
+A sidecar has a JSON metadata file next to it recording the size, mtime and
+SHA-256 of the source. A sidecar is used as is when the size and mtime still
+match. When they don't, the source is hashed, and the sidecar is only rebuilt
+if the hash changed too, so touching a file doesn't force a rebuild.
+
+Running this module compares loading every input from a fresh cache, from the
+warm cache and by decoding the text as the challenges used to.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import sys
+import struct
+from array import array
+from base64 import b64decode
+from typing import TYPE_CHECKING, Iterator, List, Optional, Union
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files')
+CACHE_DIR = os.path.join(FILES_DIR, '.cache')
+# Bumped whenever the sidecar layout changes, which invalidates every sidecar
+FORMAT_VERSION = 2
+# Line lengths are stored as '<I', fixed-width little-endian uint32s, whatever
+# the platform's native unsigned int is
+LENGTH_SIZE = 4
+
+# How each input is encoded
+DATASETS = {
+    '4.txt': 'hex-lines',
+    '6.txt': 'base64',
+    '7.txt': 'base64',
+    '8.txt': 'hex-lines',
+    '10.txt': 'base64',
+}
+
+
+class Lines:
+    """
+    Decoded lines backed by a memory-mapped sidecar. The sidecar holds the
+    length of every line as little-endian uint32s, followed by the lines as a
+    (rows, width) array of bytes.
+    """
+
+    def __init__(self, buffer: memoryview, rows: int, width: int):
+        self.rows = rows
+        self.width = width
+        lengths = buffer[:rows * LENGTH_SIZE]
+        if sys.byteorder == 'little' and array('I').itemsize == LENGTH_SIZE:
+            # The stored lengths are native uint32s, so they are read in place
+            self.lengths = lengths.cast('I')
+        else:
+            self.lengths = struct.unpack(f'<{rows}I', lengths)
+        self.data = buffer[rows * LENGTH_SIZE:rows * LENGTH_SIZE + rows * width]
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, index: int) -> memoryview:
+        if index < 0:
+            index += self.rows
+        if not 0 <= index < self.rows:
+            raise IndexError('line index out of range')
+        start = index * self.width
+        return self.data[start:start + self.lengths[index]]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        for i in range(self.rows):
+            yield self[i]
+
+    @property
+    def array(self) -> 'np.ndarray':
+        """
+        The lines as a read-only (rows, width) uint8 array, zero padded past
+        the end of each line
+        """
+        import numpy as np
+        return np.frombuffer(self.data, dtype=np.uint8).reshape(self.rows, self.width)
+
+
+def decode_base64(text: bytes) -> bytes:
+    return b64decode(text)
+
+
+def decode_hex_lines(text: bytes) -> List[bytes]:
+    return [bytes.fromhex(line.decode()) for line in text.split() if line]
+
+
+def pack_lines(decoded: List[bytes]) -> bytes:
+    width = max(map(len, decoded), default=0)
+    lengths = struct.pack(f'<{len(decoded)}I', *map(len, decoded))
+    return lengths + b''.join(line.ljust(width, b'\0') for line in decoded)
+
+
+def _paths(name: str, cache_dir: str):
+    return os.path.join(cache_dir, name + '.bin'), os.path.join(cache_dir, name + '.json')
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: str, data: bytes):
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+def _read_metadata(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_sidecar(source: str, kind: str, data_path: str, metadata_path: str) -> dict:
+    """
+    Decodes the source into the sidecar and returns its metadata
+    """
+    with open(source, 'rb') as f:
+        text = f.read()
+    stat = os.stat(source)
+
+    metadata = {
+        'version': FORMAT_VERSION,
+        'kind': kind,
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_sha256': hashlib.sha256(text).hexdigest(),
+    }
+    if kind == 'base64':
+        data = decode_base64(text)
+    elif kind == 'hex-lines':
+        decoded = decode_hex_lines(text)
+        data = pack_lines(decoded)
+        metadata['rows'] = len(decoded)
+        metadata['width'] = max(map(len, decoded), default=0)
+    else:
+        raise ValueError(f"Unknown dataset kind: {kind}")
+    metadata['size'] = len(data)
+
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    # The data goes first, so a sidecar is never described by metadata that
+    # was written for other data
+    _write_atomic(data_path, data)
+    _write_atomic(metadata_path, json.dumps(metadata, indent=2).encode())
+    return metadata
+
+
+def sidecar(name: str, kind: Optional[str] = None, directory: str = FILES_DIR,
+            cache_dir: str = CACHE_DIR) -> dict:
+    """
+    Makes sure the sidecar of an input is up to date, building it if needed,
+    and returns its metadata. Metadata['path'] is the sidecar data file.
+    """
+    kind = kind or DATASETS[name]
+    source = os.path.join(directory, name)
+    data_path, metadata_path = _paths(name, cache_dir)
+
+    metadata = _read_metadata(metadata_path)
+    stat = os.stat(source)
+    usable = (metadata is not None and metadata.get('version') == FORMAT_VERSION
+              and metadata.get('kind') == kind
+              and os.path.exists(data_path) and os.path.getsize(data_path) == metadata['size'])
+
+    if not usable or metadata['source_size'] != stat.st_size:
+        metadata = build_sidecar(source, kind, data_path, metadata_path)
+    elif metadata['source_mtime_ns'] != stat.st_mtime_ns:
+        # Touched, but maybe not changed
+        if _hash_file(source) == metadata['source_sha256']:
+            metadata['source_mtime_ns'] = stat.st_mtime_ns
+            _write_atomic(metadata_path, json.dumps(metadata, indent=2).encode())
+        else:
+            metadata = build_sidecar(source, kind, data_path, metadata_path)
+
+    metadata['path'] = data_path
+    return metadata
+
+
+def _map(path: str, size: int) -> memoryview:
+    if size == 0:
+        # Empty files can't be mapped
+        return memoryview(b'')
+    with open(path, 'rb') as f:
+        # The mapping stays open for as long as a view of it is alive
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def blob(name: str, **kwargs) -> memoryview:
+    """
+    Returns the decoded contents of a base64 input
+    """
+    metadata = sidecar(name, **kwargs)
+    if metadata['kind'] != 'base64':
+        raise ValueError(f"{name} is not a blob")
+    return _map(metadata['path'], metadata['size'])
+
+
+def lines(name: str, **kwargs) -> Lines:
+    """
+    Returns the decoded lines of a hex input
+    """
+    metadata = sidecar(name, **kwargs)
+    if metadata['kind'] != 'hex-lines':
+        raise ValueError(f"{name} is not line-oriented")
+    return Lines(_map(metadata['path'], metadata['size']), metadata['rows'], metadata['width'])
+
+
+def load(name: str, **kwargs) -> Union[memoryview, Lines]:
+    kind = kwargs.get('kind') or DATASETS[name]
+    return lines(name, **kwargs) if kind == 'hex-lines' else blob(name, **kwargs)
+
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+    import timeit
+
+    def decode_text(name: str):
+        with open(os.path.join(FILES_DIR, name)) as f:
+            if DATASETS[name] == 'base64':
+                return b64decode(f.read())
+            return [bytes.fromhex(line.strip()) for line in f if line.strip()]
+
+    def load_all(cache_dir: str):
+        return [load(name, cache_dir=cache_dir) for name in DATASETS]
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        # The sidecars decode to exactly what the text does
+        for name, data in zip(DATASETS, load_all(cache_dir)):
+            expected = decode_text(name)
+            if isinstance(data, Lines):
+                assert [bytes(line) for line in data] == expected, name
+                assert data.array.shape == (len(expected), max(map(len, expected)))
+            else:
+                assert bytes(data) == expected, name
+        print('[+] Sidecars match the decoded text')
+
+        # A touched source is rehashed but not rebuilt. The source is a copy,
+        # so the tracked file is left alone.
+        source_dir = os.path.join(cache_dir, 'sources')
+        os.makedirs(source_dir)
+        shutil.copy(os.path.join(FILES_DIR, '7.txt'), source_dir)
+        data_path = sidecar('7.txt', directory=source_dir, cache_dir=cache_dir)['path']
+        built = os.stat(data_path).st_mtime_ns
+        stat = os.stat(os.path.join(source_dir, '7.txt'))
+        os.utime(os.path.join(source_dir, '7.txt'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        sidecar('7.txt', directory=source_dir, cache_dir=cache_dir)
+        assert os.stat(data_path).st_mtime_ns == built
+        print('[+] Touching a source keeps its sidecar')
+
+        def cold():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            load_all(cache_dir)
+
+        for label, func in (('decode the text', lambda: [decode_text(name) for name in DATASETS]),
+                            ('build the sidecars', cold),
+                            ('map the sidecars', lambda: load_all(cache_dir))):
+            runs, elapsed = timeit.Timer(func).autorange()
+            print(f'[+] {label:<20} {elapsed / runs * 1e3:>8.3f} ms for all {len(DATASETS)} inputs')
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Automated ECB cut-and-paste forger for profile_for style oracles
+
+chal13 works out the layout of the cookie by hand from the field names. The
+forger finds it by probing an oracle that maps an email address to an
+encrypted profile cookie:
+
+1. The combined length of everything around the email, from the point where
+   the ciphertext grows by a block. This is a binary search over email lengths.
+2. The length of the fields before the email, from the shortest run of 'A's
+   that produces two identical ciphertext blocks. This is also a binary search.
+
+With the layout known, it takes two more queries to forge cookies:
+
+- one that pushes the value being replaced to the start of the last block
+- one email that carries a PKCS#7 padded block for every new value at once
+
+Forging many different values therefore costs the same as forging one, and
+the base query is reused for any further values of the same length.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+from padding import pkcs7_pad
+
+
+@dataclass
+class Layout:
+    block_size: int
+    # Bytes before and after the attacker controlled email
+    prefix_length: int
+    suffix_length: int
+
+
+class CookieForger:
+    def __init__(self, oracle: Callable[[str], bytes], block_size: int = 16):
+        self.oracle = oracle
+        self.block_size = block_size
+        self.queries = 0
+        self.layout = None
+        # Truncated base ciphertexts keyed by the length of the replaced value
+        self.bases: Dict[int, bytes] = {}
+
+    def query(self, email: str) -> bytes:
+        self.queries += 1
+        return self.oracle(email)
+
+    def first_repeated_block(self, ciphertext: bytes) -> int:
+        """
+        Returns the index of the first block that equals the block after it,
+        or -1 if there is none
+        """
+        bs = self.block_size
+        blocks = [ciphertext[i:i + bs] for i in range(0, len(ciphertext), bs)]
+        for i in range(len(blocks) - 1):
+            if blocks[i] == blocks[i + 1]:
+                return i
+        return -1
+
+    def discover(self) -> Layout:
+        if self.layout is not None:
+            return self.layout
+        bs = self.block_size
+
+        # The ciphertext grows by a block at the first email length that fills
+        # the last block exactly: prefix + suffix + length == base length
+        base_length = len(self.query(''))
+        low, high = 1, bs
+        while low < high:
+            middle = (low + high) // 2
+            if len(self.query('A' * middle)) > base_length:
+                high = middle
+            else:
+                low = middle + 1
+        fixed_length = base_length - low
+
+        # The shortest run of 'A's containing two full blocks is 2 blocks plus
+        # the bytes needed to reach the next block boundary
+        low, high = 2 * bs, 3 * bs - 1
+        first_block = -1
+        while low < high:
+            middle = (low + high) // 2
+            index = self.first_repeated_block(self.query('A' * middle))
+            if index >= 0:
+                high = middle
+                first_block = index
+            else:
+                low = middle + 1
+        if first_block < 0:
+            first_block = self.first_repeated_block(self.query('A' * low))
+        alignment = low - 2 * bs
+        prefix_length = first_block * bs - alignment
+
+        self.layout = Layout(bs, prefix_length, fixed_length - prefix_length)
+        return self.layout
+
+    def base(self, old_value: str) -> bytes:
+        """
+        Returns ciphertext blocks covering everything up to the value being
+        replaced, with the value pushed to the start of the following block
+        """
+        layout = self.discover()
+        bs = layout.block_size
+        if len(old_value) not in self.bases:
+            cut = layout.prefix_length + layout.suffix_length - len(old_value)
+            email = 'A' * (-cut % bs)
+            ciphertext = self.query(email)
+            self.bases[len(old_value)] = ciphertext[:cut + len(email)]
+        return self.bases[len(old_value)]
+
+    def forge_many(self, old_value: str, new_values: List[str]) -> List[bytes]:
+        """
+        Forges one cookie per new value, each ending in that value instead of
+        old_value. All value blocks are encrypted with a single query.
+        """
+        layout = self.discover()
+        bs = layout.block_size
+        base = self.base(old_value)
+
+        # Fill up the prefix's last block, then one padded block run per value
+        fill = 'A' * (-layout.prefix_length % bs)
+        value_blocks = [pkcs7_pad(value.encode(), bs).decode('latin-1') for value in new_values]
+        ciphertext = self.query(fill + ''.join(value_blocks))
+
+        forged = []
+        offset = layout.prefix_length + len(fill)
+        for block in value_blocks:
+            forged.append(base + ciphertext[offset:offset + len(block)])
+            offset += len(block)
+        return forged
+
+    def forge(self, old_value: str, new_value: str) -> bytes:
+        return self.forge_many(old_value, [new_value])[0]
+
+
+if __name__ == '__main__':
+    from chal13 import Oracle, profile_for
+
+    oracle = Oracle()
+    forger = CookieForger(lambda email: oracle.encrypt(profile_for(email).encode()))
+
+    layout = forger.discover()
+    print(f'[+] Discovered {layout} with {forger.queries} queries')
+
+    admin = forger.forge('user', 'admin')
+    print(f'[+] Forged admin cookie: {oracle.decrypt_profile(admin)}')
+    print(f'[+] Total queries: {forger.queries}')
+
+    roles = ['admin', 'root', 'superuser', 'a-role-longer-than-one-block']
+    for role, cookie in zip(roles, forger.forge_many('user', roles)):
+        profile = oracle.decrypt_profile(cookie)
+        assert profile['role'] == role, profile
+        print(f'[+] Forged: {profile}')
+    print(f'[+] Total queries after forging {len(roles)} more cookies: {forger.queries}')
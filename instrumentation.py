@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Oracle instrumentation
+
+Records how the oracles are used: call counts, bytes in/out and a latency
+histogram per call. Calls are grouped by the phase the attack is currently in
+(e.g. "block-size detection", "dictionary build", "match") so it is easy to see
+where the queries of an attack are going.
+
+Methods are instrumented with the `instrumented` decorator. On a class that
+inherits from InstrumentedMixin the metrics are stored per instance in
+`self.metrics`; on a plain function they are stored on the wrapper itself, i.e.
+`encryption_oracle.metrics`.
+
+    oracle = Oracle()
+    with oracle.metrics.phase('block-size detection'):
+        block_size = oracle.detect_block_size()
+    print(oracle.metrics.to_json())
+"""
+
+import bisect
+import functools
+import json
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+DEFAULT_PHASE = 'default'
+
+# Upper bounds (in microseconds) of the latency histogram buckets. Anything
+# slower than the last bound lands in the overflow bucket.
+LATENCY_BUCKETS_US = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 100000)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """
+    Raised by an attack that would need more oracle queries than it was
+    allowed to make
+    """
+
+
+class PhaseStats:
+    """
+    Counters for all calls made during a single phase
+    """
+    def __init__(self):
+        self.calls = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_time = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_US) + 1)
+
+    def record(self, bytes_in: int, bytes_out: int, elapsed: float):
+        self.calls += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.total_time += elapsed
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS_US, elapsed * 1e6)] += 1
+
+    def to_dict(self) -> dict:
+        labels = [f'<={bound}us' for bound in LATENCY_BUCKETS_US]
+        labels.append(f'>{LATENCY_BUCKETS_US[-1]}us')
+        return {
+            'calls': self.calls,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'total_time': self.total_time,
+            'latency_histogram': dict(zip(labels, self.histogram)),
+        }
+
+
+class OracleMetrics:
+    """
+    Per-phase call statistics for a single oracle
+    """
+    def __init__(self):
+        self.phases: Dict[str, PhaseStats] = {}
+        self.current_phase = DEFAULT_PHASE
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Tags every call made inside the with block with the phase name
+        """
+        previous_phase = self.current_phase
+        self.current_phase = name
+        try:
+            yield self
+        finally:
+            self.current_phase = previous_phase
+
+    def record(self, bytes_in: int, bytes_out: int, elapsed: float):
+        stats = self.phases.get(self.current_phase)
+        if stats is None:
+            stats = self.phases[self.current_phase] = PhaseStats()
+        stats.record(bytes_in, bytes_out, elapsed)
+
+    @property
+    def calls(self) -> int:
+        return sum(stats.calls for stats in self.phases.values())
+
+    def reset(self):
+        self.phases.clear()
+
+    def to_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'phases': {name: stats.to_dict() for name, stats in self.phases.items()},
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+class InstrumentedMixin:
+    """
+    Gives a class a lazily created `metrics` attribute for use by `instrumented`
+    methods, so the oracle classes don't have to touch their __init__
+    """
+    @property
+    def metrics(self) -> OracleMetrics:
+        if '_metrics' not in self.__dict__:
+            self._metrics = OracleMetrics()
+        return self._metrics
+
+
+def instrumented(func: Callable) -> Callable:
+    """
+    Records the call count, input/output sizes and latency of func. The first
+    argument after self is counted as the input and the return value as the
+    output.
+    """
+    perf_counter = time.perf_counter
+    sized = (bytes, bytearray, str)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = perf_counter() - start
+
+        if args and isinstance(args[0], InstrumentedMixin):
+            metrics = args[0].metrics
+            data = args[1] if len(args) > 1 else None
+        else:
+            metrics = wrapper.metrics
+            data = args[0] if args else None
+
+        bytes_in = len(data) if isinstance(data, sized) else 0
+        bytes_out = len(result) if isinstance(result, sized) else 0
+        metrics.record(bytes_in, bytes_out, elapsed)
+        return result
+
+    wrapper.metrics = OracleMetrics()
+    return wrapper
+
+
+class ProgressReporter:
+    """
+    Reports the progress of a long running attack to a callback as a dict with
+    the number of bytes recovered, the elapsed time and the recovery rate
+    """
+    def __init__(self, callback: Callable[[dict], None], total: Optional[int] = None,
+                 metrics: Optional[OracleMetrics] = None):
+        self.callback = callback
+        self.total = total
+        self.metrics = metrics
+        self.start = time.perf_counter()
+
+    def update(self, recovered: int):
+        elapsed = time.perf_counter() - self.start
+        progress = {
+            'recovered': recovered,
+            'total': self.total,
+            'elapsed': elapsed,
+            'bytes_per_second': recovered / elapsed if elapsed else 0.0,
+        }
+        if self.metrics is not None:
+            progress['queries'] = self.metrics.calls
+        self.callback(progress)
+
+
+def print_progress(progress: dict):
+    """
+    Default progress callback, prints a single status line
+    """
+    total = progress['total'] if progress['total'] is not None else '?'
+    line = f"[*] {progress['recovered']}/{total} bytes, {progress['bytes_per_second']:.1f} B/s"
+    if 'queries' in progress:
+        line += f", {progress['queries']} queries"
+    print(line)
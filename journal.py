@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Persistent query journal for the byte-at-a-time attacks
+
+Stores every oracle input -> ciphertext pair and the plaintext recovered so far
+in a sqlite database. A restarted attack picks up the recovered plaintext with
+load_progress() and any query it repeats is answered from the journal instead
+of the oracle.
+
+The journal is only valid for as long as the target keeps the same key, so each
+journal is tagged with a target name and entries for other targets are ignored.
+The number of stored queries is capped; when the cap is exceeded the least
+recently used entries are evicted.
+"""
+
+import sqlite3
+from typing import Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    target TEXT NOT NULL,
+    input BLOB NOT NULL,
+    output BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (target, input)
+);
+CREATE INDEX IF NOT EXISTS queries_lru ON queries (target, last_used);
+CREATE TABLE IF NOT EXISTS progress (
+    target TEXT PRIMARY KEY,
+    plaintext BLOB NOT NULL
+);
+"""
+
+
+class Journal:
+    def __init__(self, path: str, target: str = 'default', max_entries: int = 1_000_000,
+                 commit_interval: int = 256):
+        self.target = target
+        self.max_entries = max_entries
+        self.commit_interval = commit_interval
+        self.hits = 0
+        self.misses = 0
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+        # Keep the entry count and LRU clock in memory so that lookups don't
+        # need an aggregate query each time
+        self.entries, clock = self.db.execute(
+            'SELECT COUNT(*), COALESCE(MAX(last_used), 0) FROM queries WHERE target = ?',
+            (target,)
+        ).fetchone()
+        self.clock = clock
+        self.pending = 0
+
+    def lookup(self, query: bytes) -> Optional[bytes]:
+        row = self.db.execute(
+            'SELECT output FROM queries WHERE target = ? AND input = ?',
+            (self.target, query)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.clock += 1
+        self.db.execute(
+            'UPDATE queries SET last_used = ? WHERE target = ? AND input = ?',
+            (self.clock, self.target, query)
+        )
+        self._written()
+        return row[0]
+
+    def store(self, query: bytes, ciphertext: bytes):
+        self.clock += 1
+        # rowcount is 1 for an upsert whether it inserted or updated, so only
+        # a query that wasn't stored yet counts as a new entry
+        exists = self.db.execute(
+            'SELECT 1 FROM queries WHERE target = ? AND input = ?', (self.target, query)
+        ).fetchone() is not None
+        self.db.execute(
+            """
+            INSERT INTO queries (target, input, output, last_used) VALUES (?, ?, ?, ?)
+            ON CONFLICT (target, input) DO UPDATE SET output = excluded.output, last_used = excluded.last_used
+            """,
+            (self.target, query, ciphertext, self.clock)
+        )
+        if not exists:
+            self.entries += 1
+        if self.entries > self.max_entries:
+            self.evict()
+        self._written()
+
+    def evict(self):
+        """
+        Drops the least recently used entries. A tenth of the cap is evicted at
+        once so that a full journal doesn't pay for an eviction on every store
+        """
+        target_entries = self.max_entries - max(1, self.max_entries // 10)
+        excess = self.entries - target_entries
+        self.db.execute(
+            """
+            DELETE FROM queries WHERE target = ? AND input IN (
+                SELECT input FROM queries WHERE target = ? ORDER BY last_used LIMIT ?
+            )
+            """,
+            (self.target, self.target, excess)
+        )
+        self.entries = target_entries
+
+    def load_progress(self) -> bytes:
+        row = self.db.execute(
+            'SELECT plaintext FROM progress WHERE target = ?', (self.target,)
+        ).fetchone()
+        return row[0] if row else b''
+
+    def save_progress(self, plaintext: bytes):
+        self.db.execute(
+            'INSERT OR REPLACE INTO progress (target, plaintext) VALUES (?, ?)',
+            (self.target, plaintext)
+        )
+        # Progress is what a restart resumes from, so always commit it
+        self.commit()
+
+    def _written(self):
+        self.pending += 1
+        if self.pending >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JournaledOracle:
+    """
+    Wraps an oracle so that encrypt() is answered from the journal when
+    possible. The oracle's own helper methods (detect_block_size,
+    create_dictionary, ...) are rebound to the wrapper so that the queries they
+    make go through the journal too.
+    """
+    def __init__(self, oracle, journal: Journal):
+        self.oracle = oracle
+        self.journal = journal
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        ciphertext = self.journal.lookup(plaintext)
+        if ciphertext is None:
+            ciphertext = self.oracle.encrypt(plaintext)
+            self.journal.store(plaintext, ciphertext)
+        return ciphertext
+
+    def __getattr__(self, name):
+        attr = getattr(type(self.oracle), name, None)
+        if callable(attr):
+            return attr.__get__(self)
+        return getattr(self.oracle, name)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Batch ECB/CBC mode classifier for the chal11 encryption oracle
+
+The chosen input is a run of identical bytes. Under ECB, every full block that
+lies inside the run encrypts to the same ciphertext block, wherever the random
+prefix leaves the run aligned. Classifying a ciphertext therefore only needs a
+check for two equal adjacent blocks, which is done for a whole batch of
+ciphertexts at once with NumPy.
+
+min_probe_length() works out the shortest run that is guaranteed to contain two
+full blocks for every possible prefix length.
+
+Usage: mode_classifier.py [N]
+Runs the oracle N times and reports accuracy, a confusion matrix and
+classifications per second.
+"""
+
+import sys
+import time
+from typing import Iterable
+
+import numpy as np
+
+from chal11 import encrypt_random_mode
+
+
+MODE_CBC = 0
+MODE_ECB = 1
+MODE_NAMES = ('CBC', 'ECB')
+
+
+def min_probe_length(prefix_min: int = 5, prefix_max: int = 10, block_size: int = 16,
+                     repeats: int = 2) -> int:
+    """
+    Returns the shortest chosen input that contains `repeats` full blocks of
+    its own bytes for every prefix length in [prefix_min, prefix_max]
+    """
+    longest = 0
+    for prefix_length in range(prefix_min, prefix_max + 1):
+        # Bytes needed to reach the next block boundary, then the full blocks
+        alignment = -prefix_length % block_size
+        longest = max(longest, alignment + repeats * block_size)
+    return longest
+
+
+def make_probe(prefix_min: int = 5, prefix_max: int = 10, block_size: int = 16) -> bytes:
+    return b'A' * min_probe_length(prefix_min, prefix_max, block_size)
+
+
+def classify_modes(ciphertexts: Iterable[bytes], block_size: int = 16) -> np.ndarray:
+    """
+    Classifies each ciphertext as MODE_ECB or MODE_CBC. Ciphertexts are grouped
+    by length and each group is checked for equal adjacent blocks in a single
+    vectorized pass.
+    """
+    ciphertexts = list(ciphertexts)
+    labels = np.zeros(len(ciphertexts), dtype=np.uint8)
+
+    groups = {}
+    for i, ciphertext in enumerate(ciphertexts):
+        groups.setdefault(len(ciphertext) // block_size, []).append(i)
+
+    # Compare blocks as 64-bit words where possible, bytes otherwise
+    word = np.uint64 if block_size % 8 == 0 else np.uint8
+
+    for block_count, indices in groups.items():
+        if block_count < 2:
+            continue
+
+        usable = block_count * block_size
+        data = b''.join(ciphertexts[i][:usable] for i in indices)
+        blocks = np.frombuffer(data, dtype=word).reshape(len(indices), block_count, -1)
+        repeated = (blocks[:, 1:] == blocks[:, :-1]).all(axis=2).any(axis=1)
+        labels[indices] = repeated
+
+    return labels
+
+
+def classify_mode(ciphertext: bytes, block_size: int = 16) -> str:
+    return MODE_NAMES[classify_modes([ciphertext], block_size)[0]]
+
+
+def confusion_matrix(actual: np.ndarray, predicted: np.ndarray) -> np.ndarray:
+    """
+    Returns a 2x2 matrix with the actual mode as the row and the predicted
+    mode as the column
+    """
+    matrix = np.zeros((2, 2), dtype=np.int64)
+    np.add.at(matrix, (actual, predicted), 1)
+    return matrix
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    probe = make_probe()
+    print(f'[+] Minimum probe length: {len(probe)} bytes')
+
+    start = time.perf_counter()
+    actual = np.empty(count, dtype=np.uint8)
+    ciphertexts = []
+    for i in range(count):
+        mode, ciphertext = encrypt_random_mode(probe)
+        actual[i] = MODE_NAMES.index(mode)
+        ciphertexts.append(ciphertext)
+    oracle_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predicted = classify_modes(ciphertexts)
+    classify_time = time.perf_counter() - start
+
+    matrix = confusion_matrix(actual, predicted)
+    accuracy = np.trace(matrix) / count
+
+    print(f'[+] Oracle calls: {count} in {oracle_time:.2f}s')
+    print(f'[+] Classified in {classify_time:.3f}s ({count / classify_time:,.0f} classifications/s)')
+    print(f'[+] Accuracy: {accuracy:.4%}')
+    print('[+] Confusion matrix (rows: actual, columns: predicted)')
+    print(f"{'':>8}{'CBC':>10}{'ECB':>10}")
+    for mode, row in zip(MODE_NAMES, matrix):
+        print(f'{mode:>8}{row[0]:>10}{row[1]:>10}')
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+PKCS#7 padding
+
+The one implementation of PKCS#7 used by every oracle in the repo. chal9 keeps
+its original 0x04 padding as the solution to that challenge.
+
+Padding n bytes appends n copies of the byte n, where n is between 1 and the
+block size. Block aligned data gets a full block of padding. Stripping checks
+that the data is a whole number of blocks, that n is between 1 and the block
+size and that all n bytes equal n. Anything else raises PaddingError.
+
+pkcs7_strip_view() returns a memoryview of the payload instead of a copy, and
+pkcs7_validate_batch() checks many final blocks at once with NumPy. NumPy is
+only imported by the batch validator, so the oracles that just pad and strip
+don't pay for it at startup.
+
+Running this module benchmarks the throughput of each function.
+"""
+
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class PaddingError(ValueError):
+    pass
+
+
+# Padding for every possible length, so pad and strip never build it
+_PADDING = [bytes([n]) * n for n in range(256)]
+
+
+def pkcs7_pad(data: bytes, block_size: int = 16) -> bytes:
+    """
+    Applies PKCS#7 padding to the data to make it a multiple of the block size
+    """
+    if not 0 < block_size < 256:
+        raise ValueError(f"Invalid PKCS#7 block size: {block_size}")
+    return data + _PADDING[block_size - len(data) % block_size]
+
+
+def pkcs7_padding_length(data: bytes, block_size: int = 16) -> int:
+    """
+    Returns the number of padding bytes at the end of the data, raising
+    PaddingError if the padding is invalid
+    """
+    if not data or len(data) % block_size:
+        raise PaddingError("Data is not a whole number of blocks")
+    n = data[-1]
+    if not 0 < n <= block_size or not data.endswith(_PADDING[n]):
+        raise PaddingError("Invalid PKCS#7 padding")
+    return n
+
+
+def pkcs7_strip(data: bytes, block_size: int = 16) -> bytes:
+    """
+    Strips PKCS#7 padding from the data
+    """
+    return data[:-pkcs7_padding_length(data, block_size)]
+
+
+def pkcs7_strip_view(data: Union[bytes, bytearray, memoryview], block_size: int = 16) -> memoryview:
+    """
+    Strips PKCS#7 padding from the data and returns a memoryview of the payload
+    without copying it
+    """
+    view = memoryview(data)
+    if not view or len(view) % block_size:
+        raise PaddingError("Data is not a whole number of blocks")
+    # Only the final block is copied to check the padding
+    return view[:len(view) - pkcs7_padding_length(view[-block_size:].tobytes(), block_size)]
+
+
+def pkcs7_validate_batch(blocks: Union[bytes, 'np.ndarray'], block_size: int = 16) -> 'np.ndarray':
+    """
+    Validates the padding of many final blocks at once. blocks is either the
+    final blocks joined together or an array with one block per row. Returns
+    the padding length of each block, or 0 where the padding is invalid.
+    """
+    import numpy as np
+
+    if isinstance(blocks, np.ndarray):
+        blocks = blocks.reshape(-1, block_size)
+    else:
+        blocks = np.frombuffer(blocks, dtype=np.uint8).reshape(-1, block_size)
+
+    padding = blocks[:, -1].astype(np.intp)
+    # Positions that have to hold the pad byte: the last n of each block
+    in_padding = np.arange(block_size) >= block_size - padding[:, None]
+    matches = (blocks == blocks[:, -1:]) | ~in_padding
+    valid = (padding >= 1) & (padding <= block_size) & matches.all(axis=1)
+    return np.where(valid, padding, 0)
+
+
+if __name__ == '__main__':
+    import os
+    import timeit
+
+    from chal9 import pkcs7_pad as chal9_pkcs7_pad
+
+    # The copies this module replaced
+    def legacy_pkcs7_pad(data: bytes, block_size: int) -> bytes:
+        padding_required = block_size - len(data) % block_size
+        return data + bytes([padding_required]) * padding_required
+
+    def legacy_pkcs7_strip(data: bytes) -> bytes:
+        expected_padding_length = data[-1]
+        expected_padding = expected_padding_length.to_bytes(1, byteorder='big') * expected_padding_length
+        actual_padding = data[-expected_padding_length:]
+        if expected_padding != actual_padding:
+            raise ValueError("Invalid PKCS#7 padding")
+        return data[:-expected_padding_length]
+
+    for length in range(64):
+        data = os.urandom(length)
+        padded = pkcs7_pad(data)
+        assert len(padded) % 16 == 0 and len(padded) > length
+        assert pkcs7_strip(padded) == data
+        assert bytes(pkcs7_strip_view(padded)) == data
+    assert pkcs7_pad(b'YELLOW SUBMARINE') == b'YELLOW SUBMARINE' + b'\x10' * 16
+    assert pkcs7_strip(pkcs7_pad(b'hello', 12), 12) == b'hello'
+    assert len(chal9_pkcs7_pad(b'YELLOW SUBMARINE', 20)) == 20
+
+    invalid = [
+        b'',
+        b'ICE ICE BABY\x04\x04\x04',
+        b'ICE ICE BABY\x05\x05\x05\x05',
+        b'ICE ICE BABY\x01\x02\x03\x04',
+        b'A' * 15 + b'\x00',
+        b'\x11' * 32,
+    ]
+    for data in invalid:
+        try:
+            pkcs7_strip(data)
+        except PaddingError:
+            pass
+        else:
+            raise AssertionError(f"Accepted invalid padding: {data}")
+    assert list(pkcs7_validate_batch(b''.join(d for d in invalid if len(d) == 16) + pkcs7_pad(b'x' * 13))) \
+        == [0, 0, 0, 3]
+    print('[+] PKCS#7 padding validation passed')
+
+    # Half valid, half random final blocks
+    blocks = [pkcs7_pad(os.urandom(i % 16))[-16:] if i % 2 else os.urandom(16) for i in range(10_000)]
+    messages = [os.urandom(16384) + block for block in blocks[1::2]]
+    joined = b''.join(blocks)
+    expected = []
+    for block in blocks:
+        try:
+            expected.append(len(block) - len(pkcs7_strip(block)))
+        except PaddingError:
+            expected.append(0)
+    assert pkcs7_validate_batch(joined).tolist() == expected
+
+    def strip_all(strip):
+        for block in blocks:
+            try:
+                strip(block)
+            except ValueError:
+                pass
+
+    benchmarks = [
+        ('pad', len(blocks), lambda: [legacy_pkcs7_pad(block, 16) for block in blocks],
+         lambda: [pkcs7_pad(block) for block in blocks]),
+        ('strip', len(blocks), lambda: strip_all(legacy_pkcs7_strip), lambda: strip_all(pkcs7_strip)),
+        ('strip 16 KiB', len(messages), lambda: [legacy_pkcs7_strip(m) for m in messages],
+         lambda: [pkcs7_strip(m) for m in messages]),
+        ('strip_view 16 KiB', len(messages), lambda: [legacy_pkcs7_strip(m) for m in messages],
+         lambda: [pkcs7_strip_view(m) for m in messages]),
+        ('validate_batch', len(blocks), lambda: strip_all(legacy_pkcs7_strip),
+         lambda: pkcs7_validate_batch(joined)),
+    ]
+
+    print(f"{'benchmark':<18} {'legacy (ops/s)':>16} {'padding (ops/s)':>16} {'speedup':>8}")
+    for name, count, before, after in benchmarks:
+        rates = []
+        for func in (before, after):
+            runs, elapsed = timeit.Timer(func).autorange()
+            rates.append(runs * count / elapsed)
+        print(f'{name:<18} {rates[0]:>16,.0f} {rates[1]:>16,.0f} {rates[1] / rates[0]:>7.1f}x')
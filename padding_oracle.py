@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+CBC padding oracle attack engine
+
+Recovers CBC plaintext given only an is_padding_valid(ciphertext) callable,
+e.g. one that decrypts with chal10.AES_CBC and reports whether
+padding.pkcs7_strip raised.
+
+Every block is attacked on its own: sending C' || C[i] to the oracle only
+involves C[i] and a crafted previous block C', so the blocks are spread over a
+thread pool. Within a block the intermediate state is found one byte at a
+time from the end, by searching for the C' byte that gives valid padding.
+
+Candidate plaintext bytes are tried in order of likelihood rather than 0-255:
+padding values first for the final block, then English text, then everything
+else. Once the final block's pad byte n is known, the following n - 1 bytes are
+guessed to be n as well, so the padding costs one query per byte. A valid
+result for the last byte of a block can be a false positive (e.g. the real
+plaintext ends in \\x02\\x02), so it is confirmed with a second query that
+changes the byte before it.
+"""
+
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from padding import PaddingError, pkcs7_strip
+
+
+# Most likely bytes of English plaintext first, then the rest of printable
+# ASCII, then every other byte value
+TEXT_ORDER = bytes(dict.fromkeys(
+    b' etaoinshrdlucmfwypvbgkjqxzETAOINSHRDLUCMFWYPVBGKJQXZ.,\'"-!?0123456789\n'
+    + string.printable.encode()
+    + bytes(range(256))
+))
+
+
+@dataclass
+class AttackReport:
+    plaintext: bytes
+    queries: int
+    elapsed: float
+    # Bytes recovered including the padding
+    recovered: int
+
+    @property
+    def queries_per_byte(self) -> float:
+        return self.queries / self.recovered if self.recovered else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.recovered / self.elapsed if self.elapsed else 0.0
+
+
+class PaddingOracleAttack:
+    def __init__(self, is_padding_valid: Callable[[bytes], bool], block_size: int = 16, workers: int = 8):
+        self.is_padding_valid = is_padding_valid
+        self.block_size = block_size
+        self.workers = workers
+        self.final_order = bytes(dict.fromkeys(bytes(range(1, block_size + 1)) + TEXT_ORDER))
+
+    def attack_block(self, previous: bytes, block: bytes, final: bool = False) -> Tuple[bytes, int]:
+        """
+        Returns the plaintext of block and the number of queries it took
+        """
+        bs = self.block_size
+        order = self.final_order if final else TEXT_ORDER
+        crafted = bytearray(previous)
+        intermediate = bytearray(bs)
+        plaintext = bytearray(bs)
+        queries = 0
+
+        for pad in range(1, bs + 1):
+            position = bs - pad
+            for j in range(position + 1, bs):
+                crafted[j] = intermediate[j] ^ pad
+
+            # Inside the final block's padding the next byte is the pad byte
+            hint = plaintext[-1]
+            candidates = order
+            if final and pad > 1 and pad <= hint <= bs and all(b == hint for b in plaintext[position + 1:]):
+                candidates = bytes([hint]) + order
+
+            for guess in candidates:
+                crafted[position] = previous[position] ^ guess ^ pad
+                queries += 1
+                if not self.is_padding_valid(bytes(crafted) + block):
+                    continue
+                if pad == 1 and position > 0:
+                    crafted[position - 1] ^= 0xff
+                    queries += 1
+                    confirmed = self.is_padding_valid(bytes(crafted) + block)
+                    crafted[position - 1] ^= 0xff
+                    if not confirmed:
+                        continue
+                intermediate[position] = crafted[position] ^ pad
+                plaintext[position] = guess
+                break
+            else:
+                raise ValueError(f"No byte gives valid padding at position {position}")
+
+        return bytes(plaintext), queries
+
+    def decrypt(self, ciphertext: bytes, iv: Optional[bytes] = None) -> AttackReport:
+        """
+        Recovers the plaintext of ciphertext. Without an iv, the first block of
+        ciphertext is taken to be the IV.
+        """
+        bs = self.block_size
+        if iv is not None:
+            ciphertext = iv + ciphertext
+        if len(ciphertext) % bs or len(ciphertext) < 2 * bs:
+            raise ValueError("Ciphertext must be the IV plus at least one block")
+
+        blocks = [ciphertext[i:i + bs] for i in range(0, len(ciphertext), bs)]
+        last = len(blocks) - 2
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.workers) as pool:
+            results: List[Tuple[bytes, int]] = list(pool.map(
+                lambda i: self.attack_block(blocks[i], blocks[i + 1], final=i == last),
+                range(len(blocks) - 1)
+            ))
+        elapsed = time.perf_counter() - start
+
+        padded = b''.join(plaintext for plaintext, _ in results)
+        return AttackReport(pkcs7_strip(padded, bs), sum(queries for _, queries in results), elapsed, len(padded))
+
+
+if __name__ == '__main__':
+    from chal10 import AES_CBC
+    from oracle_core import SECRET_SUFFIX, rand_bytes
+    from padding import pkcs7_pad
+
+    class PaddingOracle:
+        def __init__(self, latency: float = 0.0):
+            self.cipher = AES_CBC(rand_bytes(16), rand_bytes(16))
+            self.latency = latency
+
+        def encrypt(self, plaintext: bytes) -> bytes:
+            return self.cipher.encrypt(pkcs7_pad(plaintext, 16))
+
+        def is_padding_valid(self, ciphertext: bytes) -> bool:
+            if self.latency:
+                time.sleep(self.latency)
+            try:
+                pkcs7_strip(self.cipher.decrypt(ciphertext))
+            except PaddingError:
+                return False
+            return True
+
+    oracle = PaddingOracle()
+    for plaintext in (SECRET_SUFFIX, b'YELLOW SUBMARINE', b'\x02\x02' + b'A' * 13, bytes(range(48))):
+        attack = PaddingOracleAttack(oracle.is_padding_valid)
+        report = attack.decrypt(oracle.encrypt(plaintext), oracle.cipher.iv)
+        assert report.plaintext == plaintext, report.plaintext
+    print(f'[+] Recovered: {report.plaintext}')
+
+    report = PaddingOracleAttack(oracle.is_padding_valid).decrypt(oracle.encrypt(SECRET_SUFFIX), oracle.cipher.iv)
+    print(f'[+] Recovered {report.recovered} bytes with {report.queries} queries: '
+          f'{report.queries_per_byte:.1f} queries/byte, {report.bytes_per_second:,.0f} bytes/s')
+
+    # An oracle behind a network round trip is where attacking blocks
+    # concurrently pays off
+    oracle = PaddingOracle(latency=0.0002)
+    ciphertext = oracle.encrypt(SECRET_SUFFIX)
+    for workers in (1, 8):
+        report = PaddingOracleAttack(oracle.is_padding_valid, workers=workers).decrypt(ciphertext, oracle.cipher.iv)
+        print(f'[+] {workers} worker(s) with 0.2 ms latency: {report.bytes_per_second:,.0f} bytes/s')
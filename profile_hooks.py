@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling hooks
+
+Marks the expensive stages of the challenges (keysize scoring and column
+solving in chal6, scoring in chal4, dictionary builds in chal12/chal14 and the
+CBC block loops in chal10) so a slow run can be profiled without editing it.
+
+Profiling is off unless CRYPTOPALS_PROFILE is set to an output directory (or
+to 1 for ./profile) before the challenge modules are imported, or the script
+is run through this module:
+
+    CRYPTOPALS_PROFILE=out ./chal6.py
+    ./profile_hooks.py -o out chal14.py
+
+When disabled, `stage` returns the function unchanged and `section` returns a
+shared no-op context manager, so the marked code runs as if it wasn't marked.
+The profilers themselves are only imported once profiling is enabled, so
+importing this module costs the challenges next to nothing.
+
+When enabled, the whole run is profiled and these are written on exit:
+
+- profile.pstats and profile.txt: cProfile stats, top functions by cumulative
+  time
+- allocations.txt: tracemalloc peak and the top allocating lines
+- stages.json: call count and wall-clock time per stage
+- stacks.collapsed: stacks sampled from the main thread in the collapsed
+  format read by flamegraph.pl and speedscope
+"""
+
+import atexit
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+
+ENV_VAR = 'CRYPTOPALS_PROFILE'
+DEFAULT_DIRECTORY = 'profile'
+
+_NULL_SECTION = contextlib.nullcontext()
+
+
+class StageTimer:
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+
+    def to_dict(self) -> dict:
+        return {'calls': self.calls, 'total_time': self.total_time}
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of one thread at a fixed interval and counts each
+    distinct stack
+    """
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Profiler:
+    def __init__(self, directory: str, interval: float = 0.001):
+        import cProfile
+
+        self.directory = directory
+        self.interval = interval
+        self.timers: Dict[str, StageTimer] = {}
+        self.profile = cProfile.Profile()
+        self.sampler: Optional[StackSampler] = None
+        self.running = False
+
+    def timer(self, name: str) -> StageTimer:
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = StageTimer()
+        return timer
+
+    def start(self):
+        import tracemalloc
+        tracemalloc.start()
+        self.sampler = StackSampler(threading.get_ident(), self.interval)
+        self.sampler.start()
+        self.profile.enable()
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.profile.disable()
+        self.sampler.stop()
+        self.running = False
+
+    def write(self) -> List[str]:
+        """
+        Writes the collected data to the output directory and returns the paths
+        """
+        import io
+        import json
+        import pstats
+        import tracemalloc
+
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+
+        def path(name: str) -> str:
+            paths.append(os.path.join(self.directory, name))
+            return paths[-1]
+
+        self.profile.dump_stats(path('profile.pstats'))
+        text = io.StringIO()
+        pstats.Stats(self.profile, stream=text).sort_stats('cumulative').print_stats(40)
+        with open(path('profile.txt'), 'w') as f:
+            f.write(text.getvalue())
+
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics('lineno')[:20]
+        tracemalloc.stop()
+        with open(path('allocations.txt'), 'w') as f:
+            f.write(f'peak: {peak / 1024:.1f} KiB\ncurrent: {current / 1024:.1f} KiB\n\n')
+            f.writelines(f'{stat}\n' for stat in top)
+
+        with open(path('stages.json'), 'w') as f:
+            json.dump({name: timer.to_dict() for name, timer in self.timers.items() if timer.calls}, f, indent=2)
+
+        with open(path('stacks.collapsed'), 'w') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in self.sampler.stacks.most_common())
+
+        return paths
+
+    def summary(self) -> str:
+        lines = [f'{"stage":<32} {"calls":>8} {"total (s)":>10}']
+        for name, timer in sorted(self.timers.items(), key=lambda item: -item[1].total_time):
+            if timer.calls:
+                lines.append(f'{name:<32} {timer.calls:>8} {timer.total_time:>10.3f}')
+        return '\n'.join(lines)
+
+
+_profiler: Optional[Profiler] = None
+
+
+def enabled() -> bool:
+    return _profiler is not None
+
+
+def enable(directory: str = DEFAULT_DIRECTORY, interval: float = 0.001) -> Profiler:
+    """
+    Starts profiling the rest of the run. Only stages defined after this call
+    are timed, so call it before importing the challenge modules.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(directory, interval)
+        _profiler.start()
+        atexit.register(finish)
+    return _profiler
+
+
+def finish():
+    """
+    Stops profiling and writes the results. Runs automatically at exit.
+    """
+    if _profiler is None or not _profiler.running:
+        return
+    _profiler.stop()
+    paths = _profiler.write()
+    print(_profiler.summary(), file=sys.stderr)
+    print(f'[+] Profile written to {", ".join(paths)}', file=sys.stderr)
+
+
+def stage(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator that times every call of the function as the named stage. With
+    profiling disabled the function is returned unchanged.
+    """
+    if _profiler is None:
+        return lambda func: func
+
+    timer = _profiler.timer(name)
+    perf_counter = time.perf_counter
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.calls += 1
+                timer.total_time += perf_counter() - start
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def _timed_section(timer: StageTimer):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.calls += 1
+        timer.total_time += time.perf_counter() - start
+
+
+def section(name: str):
+    """
+    Context manager that times the with block as the named stage, for stages
+    that are part of a larger function
+    """
+    if _profiler is None:
+        return _NULL_SECTION
+    return _timed_section(_profiler.timer(name))
+
+
+if os.environ.get(ENV_VAR):
+    enable(DEFAULT_DIRECTORY if os.environ[ENV_VAR] == '1' else os.environ[ENV_VAR])
+
+
+if __name__ == '__main__':
+    import argparse
+    import runpy
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', default=DEFAULT_DIRECTORY, help='output directory (default: profile)')
+    parser.add_argument('--interval', type=float, default=1.0, help='stack sampling interval in ms (default: 1)')
+    parser.add_argument('script', help='script to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments for the script')
+    args = parser.parse_args()
+
+    # Running this file as __main__ means the challenges would import a second
+    # copy of it, so enable profiling on the importable module instead
+    import profile_hooks
+    profile_hooks.enable(args.output, args.interval / 1000)
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    runpy.run_path(args.script, run_name='__main__')
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Runs every challenge and checks its answer
+
+Each challenge is solved by importing the functions it provides and calling
+them with the challenge input, then checking the result against the known
+answer (e.g. key 88 for chal3 and key 53 for chal4). The checks run in a
+process pool with a fresh process per challenge, so the peak RSS of each one
+is measured on its own.
+
+Usage: run_all.py [-j JOBS] [--json] [-o OUTPUT] [CHALLENGE ...]
+
+Exits with status 1 if any challenge fails.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import traceback
+from typing import Callable, Dict, List
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CHECKS: Dict[int, Callable[[], str]] = {}
+
+
+def check(number: int):
+    def decorator(func):
+        CHECKS[number] = func
+        return func
+    return decorator
+
+
+def read_base64(name: str) -> memoryview:
+    import datasets
+    return datasets.blob(name)
+
+
+def read_hex_lines(name: str) -> List[memoryview]:
+    import datasets
+    return list(datasets.lines(name))
+
+
+@check(1)
+def check_chal1() -> str:
+    from chal1 import b64encode
+    result = b64encode(bytes.fromhex(
+        '49276d206b696c6c696e6720796f757220627261696e206c696b65206120706f69736f6e6f7573206d757368726f6f6d'))
+    assert result == b'SSdtIGtpbGxpbmcgeW91ciBicmFpbiBsaWtlIGEgcG9pc29ub3VzIG11c2hyb29t', result
+    return result.decode()
+
+
+@check(2)
+def check_chal2() -> str:
+    from chal2 import xor_by
+    result = xor_by(bytes.fromhex('1c0111001f010100061a024b53535009181c'),
+                    bytes.fromhex('686974207468652062756c6c277320657965'))
+    assert result.hex() == '746865206b696420646f6e277420706c6179', result.hex()
+    return result.hex()
+
+
+@check(3)
+def check_chal3() -> str:
+    from chal3 import find_xor_key
+    key, plaintext = find_xor_key(bytes.fromhex(
+        '1b37373331363f78151b7f2b783431333d78397828372d363c78373e783a393b3736'))
+    assert (key, plaintext) == (88, b"Cooking MC's like a pound of bacon"), (key, plaintext)
+    return f'key {key}'
+
+
+@check(4)
+def check_chal4() -> str:
+    from chal4 import find_xor_key
+    best = max((find_xor_key(line) for line in read_hex_lines('4.txt')), key=lambda result: result.score)
+    assert (best.key, best.plaintext) == (53, b'Now that the party is jumping\n'), best
+    return f'key {best.key}'
+
+
+@check(5)
+def check_chal5() -> str:
+    from chal5 import ice_encode
+    result = ice_encode(b"Burning 'em, if you ain't quick and nimble\nI go crazy when I hear a cymbal")
+    assert result.hex() == (
+        '0b3637272a2b2e63622c2e69692a23693a2a3c6324202d623d63343c2a26226324272765272a282b2f20430a652e2c652a3124'
+        '333a653e2b2027630c692b20283165286326302e27282f'), result.hex()
+    return result.hex()[:16] + '...'
+
+
+@check(6)
+def check_chal6() -> str:
+    from chal6 import break_repeating_xor_key, hamming_distance
+    assert hamming_distance(b'this is a test', b'wokka wokka!!!') == 37
+    keys = break_repeating_xor_key(read_base64('6.txt'))
+    assert keys == [b'Terminator X: Bring the noise'], keys
+    return f'key {keys[0].decode()!r}'
+
+
+@check(7)
+def check_chal7() -> str:
+    from chal7 import aes_ecb_decrypt
+    plaintext = aes_ecb_decrypt(read_base64('7.txt'), b'YELLOW SUBMARINE')
+    assert plaintext.startswith(b"I'm back and I'm ringin' the bell"), plaintext[:40]
+    return plaintext.split(b'\n')[0].decode().strip()
+
+
+@check(8)
+def check_chal8() -> str:
+    from chal8 import detect_aes_ecb
+    indices = [i for i, ciphertext in enumerate(read_hex_lines('8.txt')) if detect_aes_ecb(ciphertext)]
+    assert indices == [132], indices
+    return f'line {indices[0]}'
+
+
+@check(9)
+def check_chal9() -> str:
+    from chal9 import pkcs7_pad
+    result = pkcs7_pad(b'YELLOW SUBMARINE', 20)
+    assert result == b'YELLOW SUBMARINE\x04\x04\x04\x04', result
+    return repr(result)
+
+
+@check(10)
+def check_chal10() -> str:
+    from chal10 import AES_CBC
+    cipher = AES_CBC(b'YELLOW SUBMARINE', bytes(16))
+    assert cipher.decrypt(cipher.encrypt(b'YELLOW SUBMARINE' * 4)) == b'YELLOW SUBMARINE' * 4
+    plaintext = cipher.decrypt(read_base64('10.txt'))
+    assert plaintext.startswith(b"I'm back and I'm ringin' the bell"), plaintext[:40]
+    return plaintext.split(b'\n')[0].decode().strip()
+
+
+@check(11)
+def check_chal11() -> str:
+    from chal11 import detect_cipher, encrypt_random_mode
+    trials = 200
+    correct = 0
+    for _ in range(trials):
+        mode, ciphertext = encrypt_random_mode(b'A' * 64)
+        correct += detect_cipher(ciphertext) == mode
+    assert correct == trials, f'{correct}/{trials} modes detected'
+    return f'{correct}/{trials} modes detected'
+
+
+@check(12)
+def check_chal12() -> str:
+    from chal12 import Oracle, decrypt_secret
+    from oracle_core import SECRET_SUFFIX
+    oracle = Oracle()
+    secret = decrypt_secret(oracle, oracle.detect_block_size())
+    assert secret == SECRET_SUFFIX, secret
+    return f'{len(secret)} bytes, {oracle.metrics.calls} queries'
+
+
+@check(13)
+def check_chal13() -> str:
+    from chal13 import Oracle, profile_for
+    from ecb_forge import CookieForger
+    oracle = Oracle()
+    forger = CookieForger(lambda email: oracle.encrypt(profile_for(email).encode()))
+    profile = oracle.decrypt_profile(forger.forge('user', 'admin'))
+    assert profile['role'] == 'admin', profile
+    return f'role {profile["role"]}, {forger.queries} queries'
+
+
+@check(14)
+def check_chal14() -> str:
+    from chal14 import Oracle, decrypt_secret
+    from oracle_core import SECRET_SUFFIX
+    oracle = Oracle()
+    prefix_length, block_size = oracle.detect_block_size()
+    assert prefix_length == len(oracle.random_prefix), (prefix_length, len(oracle.random_prefix))
+    secret = decrypt_secret(oracle, block_size, prefix_length)
+    assert secret == SECRET_SUFFIX, secret
+    return f'{len(secret)} bytes, {oracle.metrics.calls} queries'
+
+
+@check(15)
+def check_chal15() -> str:
+    from chal15 import pkcs7_strip
+    assert pkcs7_strip(b'ICE ICE BABY\x04\x04\x04\x04') == b'ICE ICE BABY'
+    for invalid in (b'ICE ICE BABY\x05\x05\x05\x05', b'ICE ICE BABY\x01\x02\x03\x04'):
+        try:
+            pkcs7_strip(invalid)
+        except ValueError:
+            continue
+        raise AssertionError(f'Accepted invalid padding: {invalid}')
+    return 'padding validated'
+
+
+@check(16)
+def check_chal16() -> str:
+    from cbc_bitflip import BitflipPlanner
+    from chal16 import ADMIN_MARKER, Cipher, add_comments_and_quote
+    cipher = Cipher()
+    assert not cipher.is_admin(cipher.create(';admin=true;'))
+    plan = BitflipPlanner.from_encoder(add_comments_and_quote).plan_targets([ADMIN_MARKER])
+    assert cipher.is_admin(plan.apply(cipher.create(plan.userdata)))
+    return 'admin=true injected'
+
+
+def run_challenge(number: int) -> dict:
+    """
+    Runs one check in the current process, which should be a fresh one for
+    the peak RSS to belong to this challenge alone
+    """
+    os.chdir(ROOT)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    result = {'challenge': number, 'passed': False}
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result['answer'] = CHECKS[number]()
+        result['passed'] = True
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        result['traceback'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    result['peak_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run(numbers: List[int], jobs: int = None) -> List[dict]:
+    # A fresh interpreter per challenge, so the peak RSS of one isn't
+    # inherited by the next
+    with multiprocessing.get_context('spawn').Pool(jobs, maxtasksperchild=1) as pool:
+        return pool.map(run_challenge, numbers, chunksize=1)
+
+
+def print_table(results: List[dict], elapsed: float, output=sys.stdout):
+    print(f"{'challenge':<10} {'result':<6} {'time (s)':>9} {'peak RSS':>10}  answer", file=output)
+    for result in results:
+        status = 'PASS' if result['passed'] else 'FAIL'
+        answer = result.get('answer') or result.get('error', '')
+        print(f"chal{result['challenge']:<6} {status:<6} {result['seconds']:>9.3f} "
+              f"{result['peak_rss_kib'] / 1024:>7.1f} MiB  {answer}", file=output)
+    passed = sum(result['passed'] for result in results)
+    print(f'[+] {passed}/{len(results)} passed in {elapsed:.2f}s', file=output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('challenges', nargs='*', type=int, help='challenge numbers (default: all)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON instead of a table')
+    parser.add_argument('-o', '--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    numbers = args.challenges or sorted(CHECKS)
+    unknown = [number for number in numbers if number not in CHECKS]
+    if unknown:
+        parser.error(f'no check for challenge(s): {unknown}')
+
+    start = time.perf_counter()
+    results = run(numbers, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    report = {'timestamp': time.time(), 'elapsed': elapsed, 'results': results}
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(results, elapsed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if not all(result['passed'] for result in results):
+        for result in results:
+            if not result['passed']:
+                print(result['traceback'], file=sys.stderr)
+        sys.exit(1)
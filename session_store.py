@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+LRU session store for chal13 profile cookies
+
+Caches decrypted and parsed profiles keyed by their ciphertext so that a cookie
+that comes back on every request is only decrypted and parsed once. The cache
+is bounded, evicts the least recently used entry when full and expires entries
+after a TTL. Cookies that fail to decrypt to a profile are remembered in a
+second, smaller LRU with the same TTL, so a bad cookie that keeps coming back
+isn't decrypted on every request either.
+
+get_many() looks up a whole batch of cookies and decrypts all of the misses
+with a single ECB call. ECB decrypts every block independently, so the joined
+plaintext can simply be cut back into cookies. Padding is stripped with
+padding.pkcs7_strip_view, so each cookie is parsed straight out of the joined
+plaintext without being copied.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+from chal13 import parse_url_encoding
+from padding import pkcs7_strip_view
+
+
+class SessionStore:
+    def __init__(self, oracle, max_size: int = 10_000, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic, max_rejected: int = 1_000):
+        self.oracle = oracle
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.max_rejected = max_rejected
+        # ciphertext -> (expiry time, profile)
+        self.entries: OrderedDict = OrderedDict()
+        # ciphertext -> expiry time, for cookies that aren't a valid profile
+        self.rejected: OrderedDict = OrderedDict()
+
+        self.hits = 0
+        self.rejected_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalid = 0
+
+    def get(self, ciphertext: bytes) -> Optional[Dict[str, str]]:
+        """
+        Returns the profile for the cookie, or None if it doesn't decrypt to a
+        validly padded profile
+        """
+        return self.get_many([ciphertext])[0]
+
+    def get_many(self, ciphertexts: Iterable[bytes]) -> List[Optional[Dict[str, str]]]:
+        ciphertexts = list(ciphertexts)
+        now = self.clock()
+        results: List[Optional[Dict[str, str]]] = [None] * len(ciphertexts)
+
+        # Positions of every cookie that has to be decrypted. A cookie that
+        # appears several times in the batch is only decrypted once.
+        missing: Dict[bytes, List[int]] = {}
+        for i, ciphertext in enumerate(ciphertexts):
+            entry = self.entries.get(ciphertext)
+            if entry is not None:
+                expires, profile = entry
+                if expires > now:
+                    self.entries.move_to_end(ciphertext)
+                    self.hits += 1
+                    results[i] = profile
+                    continue
+                del self.entries[ciphertext]
+                self.expirations += 1
+
+            expires = self.rejected.get(ciphertext)
+            if expires is not None:
+                if expires > now:
+                    self.rejected.move_to_end(ciphertext)
+                    self.rejected_hits += 1
+                    continue
+                del self.rejected[ciphertext]
+                self.expirations += 1
+
+            self.misses += 1
+            missing.setdefault(ciphertext, []).append(i)
+
+        if missing:
+            for ciphertext, profile in self._decrypt_batch(list(missing)).items():
+                for i in missing[ciphertext]:
+                    results[i] = profile
+                if profile is not None:
+                    self._store(ciphertext, profile, now)
+                else:
+                    self._reject(ciphertext, now)
+
+        return results
+
+    def _decrypt_batch(self, ciphertexts: List[bytes]) -> Dict[bytes, Optional[Dict[str, str]]]:
+        profiles = {}
+        valid = []
+        for ciphertext in ciphertexts:
+            if ciphertext and len(ciphertext) % 16 == 0:
+                valid.append(ciphertext)
+            else:
+                profiles[ciphertext] = None
+                self.invalid += 1
+
+        if valid:
+            # Slicing the view, not the bytes, so no cookie is copied
+            plaintext = memoryview(self.oracle.decrypt(b''.join(valid)))
+            offset = 0
+            for ciphertext in valid:
+                block = plaintext[offset:offset + len(ciphertext)]
+                offset += len(ciphertext)
+                try:
+                    profiles[ciphertext] = parse_url_encoding(pkcs7_strip_view(block))
+                except (ValueError, UnicodeDecodeError):
+                    profiles[ciphertext] = None
+                    self.invalid += 1
+
+        return profiles
+
+    def _store(self, ciphertext: bytes, profile: Dict[str, str], now: float):
+        self.entries[ciphertext] = (now + self.ttl, profile)
+        self.entries.move_to_end(ciphertext)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _reject(self, ciphertext: bytes, now: float):
+        self.rejected[ciphertext] = now + self.ttl
+        self.rejected.move_to_end(ciphertext)
+        while len(self.rejected) > self.max_rejected:
+            self.rejected.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, ciphertext: bytes):
+        self.entries.pop(ciphertext, None)
+        self.rejected.pop(ciphertext, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.rejected.clear()
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.rejected_hits + self.misses
+        return {
+            'size': len(self.entries),
+            'rejected': len(self.rejected),
+            'hits': self.hits,
+            'rejected_hits': self.rejected_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.rejected_hits) / lookups if lookups else 0.0,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'invalid': self.invalid,
+        }
+
+
+if __name__ == '__main__':
+    import random
+
+    from chal13 import Oracle, profile_for
+
+    oracle = Oracle()
+    store = SessionStore(oracle, max_size=1000, ttl=60.0)
+
+    # A few thousand active users sending their cookie with every request
+    cookies = [oracle.encrypt(profile_for(f'user{i}@example.com').encode()) for i in range(2000)]
+    requests = [random.choice(cookies[:800]) if random.random() < 0.9 else random.choice(cookies)
+                for _ in range(100_000)]
+
+    start = time.perf_counter()
+    for i in range(0, len(requests), 100):
+        profiles = store.get_many(requests[i:i + 100])
+    elapsed = time.perf_counter() - start
+
+    assert store.get(cookies[5]) == {'email': 'user5@example.com', 'uid': '10', 'role': 'user'}
+    assert store.get(cookies[5][:-1]) is None
+
+    # A tampered cookie is only decrypted the first time it is seen
+    tampered = cookies[5][:-16] + cookies[6][:16]
+    calls = oracle.metrics.calls
+    assert store.get_many([tampered] * 3) == [None] * 3 and store.get(tampered) is None
+    assert oracle.metrics.calls == calls + 1
+    print(f'[+] {len(requests) / elapsed:,.0f} lookups/s')
+    print(f'[+] Store metrics: {store.metrics()}')
+    print(f'[+] Oracle decrypt calls: {oracle.metrics.calls - len(cookies)}')
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Interpreter startup benchmark
+
+Runs `python -X importtime -c STATEMENT` in a fresh interpreter for each target
+and reports the cumulative import time of the modules the statement loads,
+i.e. what a CLI tool pays before doing any work. Each target is run several
+times and the median is kept, since a single cold start is noisy.
+
+The slowest imports of each target are listed too, which is where to look when
+a module starts importing something heavy at the top level.
+
+Usage: startup_bench.py [-n RUNS] [--top N] [--json] [STATEMENT ...]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TARGETS = [
+    'import cryptopals',
+    'from cryptopals import xor_by',
+    'from cryptopals import pkcs7_pad',
+    'from cryptopals import AES_CBC',
+    'import chal4',
+    'import chal6',
+    'import chal16',
+    'import padding',
+]
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """
+    Returns the cumulative import time in microseconds of every top-level
+    import in -X importtime output. Nested imports are already counted in
+    their parent's cumulative time.
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        # Nested imports are indented by two spaces per level
+        if name.startswith('  '):
+            continue
+        times[name.strip()] = int(cumulative_us)
+    return times
+
+
+def measure(statement: str) -> Tuple[int, Dict[str, int]]:
+    """
+    Returns the total import time in microseconds caused by the statement, and
+    the time of each of its imports. Modules the bare interpreter imports at
+    startup are excluded by running an empty statement first.
+    """
+    def importtime(code: str) -> Dict[str, int]:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                                capture_output=True, text=True, check=True)
+        return parse_importtime(result.stderr)
+
+    startup = importtime('pass')
+    times = {name: us for name, us in importtime(statement).items() if name not in startup}
+    return sum(times.values()), times
+
+
+def run(statements: List[str], runs: int = 5) -> Dict[str, dict]:
+    results = {}
+    for statement in statements:
+        totals = []
+        modules: Dict[str, List[int]] = {}
+        for _ in range(runs):
+            total, times = measure(statement)
+            totals.append(total)
+            for name, us in times.items():
+                modules.setdefault(name, []).append(us)
+        results[statement] = {
+            'median_us': statistics.median(totals),
+            'min_us': min(totals),
+            'modules': {name: statistics.median(us) for name, us in modules.items()},
+        }
+    return results
+
+
+def print_table(results: Dict[str, dict], top: int = 3, output=sys.stdout):
+    print(f"{'statement':<36} {'median':>10} {'min':>10}  slowest imports", file=output)
+    for statement, result in results.items():
+        slowest = sorted(result['modules'].items(), key=lambda item: -item[1])[:top]
+        names = ', '.join(f'{name} {us / 1e3:.1f}' for name, us in slowest)
+        print(f"{statement:<36} {result['median_us'] / 1e3:>7.1f} ms {result['min_us'] / 1e3:>7.1f} ms  {names}",
+              file=output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('statements', nargs='*', help='statements to time (default: the primitives and challenges)')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='interpreter starts per statement (default: 5)')
+    parser.add_argument('--top', type=int, default=3, help='slowest imports to list per statement (default: 3)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON instead of a table')
+    args = parser.parse_args()
+
+    results = run(args.statements or TARGETS, args.runs)
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(results, args.top)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+One-pass ciphertext triage
+
+Runs every detector in the repo over a set of files while reading and decoding
+each file only once:
+
+- the file is memory-mapped and its encoding (hex lines, base64 or raw) is
+  detected from the mapped bytes
+- it is decoded once into records: one per line for hex files (as in
+  files/4.txt and files/8.txt) or a single blob for base64 and raw files
+- a byte histogram is built once per record and shared by the detectors
+- single-byte XOR (chal4), repeating-key XOR (chal6) and ECB (ecb_detect) all
+  run on the shared records
+
+Files are spread over a process pool and one JSON verdict per file is written
+as soon as that file completes.
+
+Usage: triage.py [-j JOBS] [-o OUTPUT] PATH [PATH ...]
+"""
+
+import argparse
+import binascii
+import json
+import math
+import mmap
+import os
+import re
+import sys
+from multiprocessing import Pool
+from typing import Iterator, List, Tuple
+
+from chal4 import PRINTABLE_BYTES, byte_histogram, find_xor_key_from_histogram
+from chal6 import break_repeating_xor_key
+from ecb_detect import block_repeats
+
+
+# The hex patterns run directly on the memory-mapped file without copying it
+HEX_LINES_RE = re.compile(rb'\s*(?:[0-9a-fA-F]{2})+(?:[ \t\r]*\n\s*(?:[0-9a-fA-F]{2})+)*\s*')
+HEX_LINE_RE = re.compile(rb'[0-9a-fA-F]+')
+# Matched against the data with its whitespace removed. Nesting the
+# whitespace inside a repeated group instead backtracks exponentially on
+# long runs of base64 characters followed by anything else.
+BASE64_RE = re.compile(rb'[A-Za-z0-9+/]*={0,2}')
+WHITESPACE = b' \t\n\r\x0b\x0c'
+
+# Repeating-key XOR breaking needs a few multiples of the largest keysize
+MIN_REPEATING_XOR_LENGTH = 160
+# chal4's score for an all printable result with a handful of spaces and
+# common letters
+MIN_SINGLE_BYTE_SCORE = 60
+# A repeating-key XOR key is only reported if it decrypts to mostly printable
+# text. Random data always yields some key.
+MIN_PRINTABLE_FRACTION = 0.95
+
+
+def detect_encoding(data: bytes) -> str:
+    """
+    Returns 'hex' if every line is an even number of hex digits, 'base64' if
+    the data is made of the base64 alphabet and 'raw' otherwise
+    """
+    if HEX_LINES_RE.fullmatch(data):
+        return 'hex'
+    stripped = bytes(data).translate(None, WHITESPACE)
+    if len(stripped) % 4 == 0 and BASE64_RE.fullmatch(stripped):
+        return 'base64'
+    return 'raw'
+
+
+def decode(data: bytes, encoding: str) -> Tuple[str, List[bytes]]:
+    """
+    Decodes the data into records. Data that turns out not to be valid base64
+    falls back to raw.
+    """
+    if encoding == 'hex':
+        return encoding, [binascii.unhexlify(match.group()) for match in HEX_LINE_RE.finditer(data)]
+    if encoding == 'base64':
+        try:
+            return encoding, [binascii.a2b_base64(data)]
+        except binascii.Error:
+            encoding = 'raw'
+    return encoding, [bytes(data)]
+
+
+def entropy(histogram: List[int]) -> float:
+    """
+    Shannon entropy in bits per byte
+    """
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    return -sum(count / total * math.log2(count / total) for count in histogram if count)
+
+
+def printable_fraction(data: bytes) -> float:
+    if not data:
+        return 0.0
+    return sum(count for value, count in enumerate(byte_histogram(data)) if value in PRINTABLE_BYTES) / len(data)
+
+
+def triage_file(path: str) -> dict:
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return {'path': path, 'size': 0, 'encoding': 'raw', 'records': 0}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            encoding, records = decode(mm, detect_encoding(mm))
+
+    histograms = [byte_histogram(record) for record in records]
+    total_histogram = [sum(counts) for counts in zip(*histograms)]
+
+    verdict = {
+        'path': path,
+        'size': size,
+        'encoding': encoding,
+        'records': len(records),
+        'entropy': round(entropy(total_histogram), 4),
+        'single_byte_xor': None,
+        'repeating_xor': None,
+        'ecb': [],
+    }
+
+    # Single-byte XOR: the best scoring record, solved from its histogram
+    best = None
+    for i, (record, histogram) in enumerate(zip(records, histograms)):
+        result = find_xor_key_from_histogram(histogram)
+        if best is None or result.score > best[1].score:
+            best = (i, result)
+    if best is not None and best[1].score >= MIN_SINGLE_BYTE_SCORE:
+        i, result = best
+        plaintext = find_xor_key_from_histogram(histograms[i], records[i]).plaintext
+        if printable_fraction(plaintext) == 1.0:
+            verdict['single_byte_xor'] = {
+                'record': i,
+                'key': result.key,
+                'score': result.score,
+                'plaintext': plaintext.decode('latin-1'),
+            }
+
+    # Repeating-key XOR only makes sense for a single blob of data
+    if len(records) == 1 and len(records[0]) >= MIN_REPEATING_XOR_LENGTH:
+        data = records[0]
+        keys = [
+            key for key in break_repeating_xor_key(data)
+            if printable_fraction(bytes(b ^ key[i % len(key)] for i, b in enumerate(data))) >= MIN_PRINTABLE_FRACTION
+        ]
+        if keys:
+            verdict['repeating_xor'] = {'keys': [key.hex() for key in keys]}
+
+    for i, record in enumerate(records):
+        repeats = block_repeats(record)
+        if repeats.count:
+            verdict['ecb'].append({'record': i, 'repeats': repeats.count, 'offsets': repeats.offsets})
+
+    return verdict
+
+
+def safe_triage_file(path: str) -> dict:
+    try:
+        return triage_file(path)
+    except Exception as e:
+        return {'path': path, 'error': f'{type(e).__name__}: {e}'}
+
+
+def iter_paths(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def run(paths: List[str], jobs: int = None, output=sys.stdout) -> Tuple[int, int]:
+    """
+    Triages every file under paths and writes one JSON line per file in
+    completion order. Returns the number of files and the number of errors.
+    """
+    count = errors = 0
+    with Pool(jobs) as pool:
+        for verdict in pool.imap_unordered(safe_triage_file, iter_paths(paths), chunksize=16):
+            output.write(json.dumps(verdict) + '\n')
+            output.flush()
+            count += 1
+            errors += 'error' in verdict
+    return count, errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='files or directories to triage')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('-o', '--output', help='write JSONL verdicts to this file instead of stdout')
+    args = parser.parse_args()
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        count, errors = run(args.paths, args.jobs, output)
+    finally:
+        if args.output:
+            output.close()
+    print(f'[+] Triaged {count} files ({errors} errors)', file=sys.stderr)